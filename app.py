@@ -1,15 +1,28 @@
 import os
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, current_app, render_template, request, jsonify
 from flask_socketio import SocketIO, emit, join_room
 from flask_login import LoginManager, current_user, login_required
 from flask_mail import Mail
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import re
 
 from config import Config
-from models import Anniversary, Mood, Note, db, User, Message, UserSettings, OTP
-from utils.encryption import encrypt_message, decrypt_message
+from models import Anniversary, Mood, Note, db, User, Message, UserSettings, OTP, conversation_key_for
+from utils.encryption import decrypt_message
+from utils.message_serializer import conversation_users, serialize_message
+from utils.read_receipts import queue_read_ack
+from utils.message_writer import message_writer
+from utils.message_storage import message_body_fields
+from utils.streaks import streak_service, start_nightly_reconciliation
+from utils.cluster_bus import cluster_bus
+from utils.presence import presence
+from utils.typing_relay import typing_relay
+from utils.identity_cache import identity_cache
+from utils.socket_context import socket_contexts, socket_context_required
+from utils.thumbnail_jobs import thumbnail_jobs
+from utils.blob_store import start_blob_gc
+from utils.media_storage import media_storage
 
 # Try to import email_sender from utils
 try:
@@ -24,17 +37,45 @@ socketio = SocketIO()
 mail = Mail()
 login_manager = LoginManager()
 
+def socketio_queue_options(config):
+    """Cross-process pub/sub for running several workers behind a sticky load balancer"""
+    message_queue = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not message_queue:
+        return {}
+    
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if message_queue.startswith('local://'):
+        from utils.local_pubsub import LocalPubSubManager
+        return {'client_manager': LocalPubSubManager(message_queue, channel=channel)}
+    return {'message_queue': message_queue, 'channel': channel}
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # Initialize extensions with app
     db.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode=app.config.get('SOCKETIO_ASYNC_MODE'),
+        ping_interval=app.config.get('SOCKETIO_PING_INTERVAL', 25),
+        ping_timeout=app.config.get('SOCKETIO_PING_TIMEOUT', 20),
+        max_http_buffer_size=app.config.get('SOCKETIO_MAX_HTTP_BUFFER_SIZE', 1000000),
+        **socketio_queue_options(app.config)
+    )
     mail.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
+    message_writer.init_app(app, socketio, after_write=update_chat_streak)
+    cluster_bus.init_app(app, socketio)
+    presence.init_app(app, socketio)
+    typing_relay.init_app(app, socketio)
+    identity_cache.init_app(app)
+    socket_contexts.init_app(app)
+    thumbnail_jobs.init_app(app, socketio)
+    media_storage.init_app(app)
     
     # Register blueprints
     from routes.auth_routes import auth_bp
@@ -49,7 +90,12 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Cached snapshot of the user and partner; no query on a hit
+        return identity_cache.load(int(user_id))
+    
+    @app.context_processor
+    def inject_presence():
+        return {'is_online': presence.is_visible, 'last_seen_for': presence.last_seen_for}
     
     @app.route('/')
     def index():
@@ -510,42 +556,48 @@ def create_app():
 def handle_connect():
     if current_user.is_authenticated:
         join_room(f'user_{current_user.id}')
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        socket_contexts.open(request.sid, current_user)
         
-        # Notify partner if connected
-        if current_user.partner:
-            emit('user_online', {
-                'user_id': current_user.id, 
-                'status': 'online',
-                'user_name': current_user.name
-            }, room=f'user_{current_user.partner.id}')
-        
-        emit('user_online', {'user_id': current_user.id, 'status': 'online'}, broadcast=True)
+        # Extra tabs and flapping reconnects announce nothing; only the partner hears the rest
+        presence.user_connected(current_user, request.sid)
 
 @socketio.on('disconnect')
 @login_required
 def handle_disconnect():
-    current_user.last_seen = datetime.utcnow()
-    db.session.commit()
-    emit('user_offline', {'user_id': current_user.id, 'status': 'offline'}, broadcast=True)
+    socket_contexts.close(request.sid)
+    # Stay online while another tab still holds a socket
+    presence.user_disconnected(current_user, request.sid)
+    typing_relay.stop(current_user.id, immediate=True)
 
 @socketio.on('send_message')
-@login_required
-def handle_send_message(data):
+@socket_context_required
+def handle_send_message(context, data):
     try:
-        partner = current_user.partner
-        if not partner:
+        if not context.partner_id:
             emit('error', {'message': 'No partner linked'})
             return
         
-        encrypted_content = encrypt_message(data['message'])
+        # A sent message ends the typing burst without waiting for the grace window
+        typing_relay.stop(context.user_id, immediate=True)
+        
+        body = message_body_fields(data['message'])
+        
+        # Write-behind mode: the writer group-commits and emits once the batch is durable
+        if message_writer.enabled:
+            message_writer.submit(
+                context.user_id, context.partner_id, body['content'],
+                encrypted_content=body['encrypted_content'],
+                message_type=data.get('type', 'text'),
+                sid=request.sid
+            )
+            return
         
         new_message = Message(
-            sender_id=current_user.id,
-            receiver_id=partner.id,
-            content=data['message'],
-            encrypted_content=encrypted_content,
+            sender_id=context.user_id,
+            receiver_id=context.partner_id,
+            conversation_key=conversation_key_for(context.user_id, context.partner_id),
+            content=body['content'],
+            encrypted_content=body['encrypted_content'],
             message_type=data.get('type', 'text')
         )
         
@@ -553,51 +605,53 @@ def handle_send_message(data):
         db.session.commit()
         
         # Update chat streak
-        update_chat_streak(current_user.id)
+        update_chat_streak(context.user_id, context.partner_id)
         
-        message_data = {
-            'id': new_message.id,
-            'sender_id': current_user.id,
-            'content': data['message'],
-            'timestamp': new_message.timestamp.isoformat(),
-            'type': new_message.message_type
-        }
+        message_data = serialize_message(new_message, conversation_users(current_user))
         
-        emit('new_message', message_data, room=f'user_{partner.id}')
+        emit('new_message', message_data, room=context.partner_room)
         emit('message_sent', message_data)
         
     except Exception as e:
         emit('error', {'message': 'Failed to send message'})
         logging.error(f"Message send error: {str(e)}")
 
+@socketio.on('mark_read')
+@socket_context_required
+def handle_mark_read(context, data):
+    """Acknowledge partner messages up to a high-water id; acks are debounced per burst"""
+    if not context.partner_id:
+        return
+    
+    try:
+        up_to_id = int(data.get('up_to_id'))
+    except (AttributeError, TypeError, ValueError):
+        emit('error', {'message': 'Invalid read receipt'})
+        return
+    
+    queue_read_ack(current_app._get_current_object(), context.user_id, context.partner_id, up_to_id)
+
 @socketio.on('typing')
-@login_required
-def handle_typing(data):
-    partner = current_user.partner
-    if partner:
-        emit('user_typing', {
-            'user_id': current_user.id,
-            'user_name': current_user.name
-        }, room=f'user_{partner.id}')
+@socket_context_required
+def handle_typing(context, data):
+    # Only the start of a burst reaches the partner
+    typing_relay.start(context.user_id, context.partner_id, context.name, context.typing_indicators)
 
 @socketio.on('stop_typing')
-@login_required
-def handle_stop_typing(data):
-    partner = current_user.partner
-    if partner:
-        emit('user_stop_typing', {'user_id': current_user.id}, room=f'user_{partner.id}')
+@socket_context_required
+def handle_stop_typing(context, data):
+    typing_relay.stop(context.user_id)
 
 @socketio.on('partner_connected')
-@login_required
-def handle_partner_connected(data):
+@socket_context_required
+def handle_partner_connected(context, data):
     """Notify when partners are connected"""
-    partner = current_user.partner
-    if partner:
+    if context.partner_id:
         emit('partner_connected', {
-            'partner_id': partner.id,
-            'partner_name': partner.name,
-            'message': f'You are now connected with {partner.name}!'
-        }, room=f'user_{current_user.id}')
+            'partner_id': context.partner_id,
+            'partner_name': context.partner_name,
+            'message': f'You are now connected with {context.partner_name}!'
+        }, room=f'user_{context.user_id}')
 
 def connect_users_automatically(inviter_id, new_user):
     """Automatically connect two users when invitation is accepted"""
@@ -614,21 +668,23 @@ def connect_users_automatically(inviter_id, new_user):
         welcome_message = Message(
             sender_id=inviter.id,
             receiver_id=new_user.id,
-            content=f"Welcome to our chat, {new_user.name}! 🎉 I'm so glad you joined me on LunaLink! 💕",
-            message_type='text'
+            conversation_key=conversation_key_for(inviter.id, new_user.id),
+            message_type='text',
+            **message_body_fields(f"Welcome to our chat, {new_user.name}! 🎉 I'm so glad you joined me on LunaLink! 💕")
         )
         
         db.session.add(welcome_message)
         db.session.commit()
         
-        # Notify both users via SocketIO
-        socketio.emit('partner_connected', {
+        # Notify both users via SocketIO (through the app's instance, which carries the message queue)
+        realtime = current_app.extensions['socketio']
+        realtime.emit('partner_connected', {
             'partner_id': new_user.id,
             'partner_name': new_user.name,
             'message': f'You are now connected with {new_user.name}!'
         }, room=f'user_{inviter.id}')
         
-        socketio.emit('partner_connected', {
+        realtime.emit('partner_connected', {
             'partner_id': inviter.id,
             'partner_name': inviter.name,
             'message': f'You are now connected with {inviter.name}!'
@@ -644,32 +700,26 @@ def connect_users_automatically(inviter_id, new_user):
         db.session.rollback()
         return False
 
-def update_chat_streak(user_id):
-    from models import ChatStreak
-    user = User.query.get(user_id)
-    if user.partner:
-        streak = ChatStreak.query.filter_by(couple_id=user_id).first()
-        today = datetime.utcnow().date()
-        
-        if not streak:
-            streak = ChatStreak(couple_id=user_id, streak_count=1, last_chat_date=today)
-            db.session.add(streak)
-        else:
-            if streak.last_chat_date == today - timedelta(days=1):
-                streak.streak_count += 1
-            elif streak.last_chat_date < today - timedelta(days=1):
-                streak.streak_count = 1
-            
-            streak.last_chat_date = today
-            streak.longest_streak = max(streak.longest_streak, streak.streak_count)
+def update_chat_streak(user_id, partner_id, commit=True):
+    """Advance the couple's streak; only the first message of a UTC day hits the DB"""
+    streak_service.record_message(user_id, partner_id, commit=commit)
+
+def prepare_app(app, background_jobs=True):
+    """Create tables, apply migrations and start the background jobs a server process needs"""
+    with app.app_context():
+        db.create_all()
         
-        db.session.commit()
+        from utils.migrations import run_migrations
+        run_migrations()
+    
+    if background_jobs:
+        start_nightly_reconciliation(app, socketio)
+        start_blob_gc(app, socketio)
 
 if __name__ == '__main__':
     app = create_app()
-    
-    with app.app_context():
-        db.create_all()
+    prepare_app(app)
+    cluster_bus.start()
     
     print("\n" + "="*70)
     print("🚀 LunaLink Server Starting...")
@@ -0,0 +1,33 @@
+"""Users and logins shared by the benchmarks; import after DATABASE_URL is set."""
+from models import db, User, UserSettings
+
+def create_couples(count, offset=0):
+    """count linked couples with default settings; returns [(user_id, partner_id), ...]"""
+    couples = []
+    for i in range(offset, offset + count):
+        a = User(name=f'A{i}', email=f'a{i}@bench.local', password_hash='x', is_verified=True)
+        b = User(name=f'B{i}', email=f'b{i}@bench.local', password_hash='x', is_verified=True)
+        db.session.add_all([a, b])
+        db.session.flush()
+        a.partner_id, b.partner_id = b.id, a.id
+        db.session.add_all([UserSettings(user_id=a.id), UserSettings(user_id=b.id)])
+        couples.append((a.id, b.id))
+    db.session.commit()
+    return couples
+
+def members(couples):
+    """Every user id of the given couples, partners adjacent"""
+    return [user_id for couple in couples for user_id in couple]
+
+def http_client(app, user_id):
+    """Flask test client logged in as the given user"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+def session_cookie(app, user_id):
+    """Signed Flask session cookie that Flask-Login accepts as a logged-in user"""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'_user_id': str(user_id), '_fresh': True})
@@ -0,0 +1,81 @@
+"""Micro-benchmark for utils/imaging.py against full-decode resizing.
+
+Builds a fixture set (12MP and 4MP JPEGs, an EXIF-rotated JPEG, a 4MP PNG)
+in a temporary directory and times three ways of producing a 200px
+thumbnail and a 1280px rendition from each:
+
+  full decode   open, exif_transpose, LANCZOS resize (what renditions did)
+  thumbnail()   the old Image.thumbnail() helpers, no orientation handling
+  pipeline      open_bounded(): JPEG draft + reduce, orientation once
+
+Usage: python benchmarks/imaging.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageOps
+
+from utils.imaging import open_bounded
+
+def build_fixtures(folder):
+    fixtures = {}
+    photo = Image.effect_noise((4000, 3000), 40).convert('RGB')
+
+    fixtures['jpeg 12MP'] = os.path.join(folder, 'photo_12mp.jpg')
+    photo.save(fixtures['jpeg 12MP'], 'JPEG', quality=90)
+
+    fixtures['jpeg 4MP'] = os.path.join(folder, 'photo_4mp.jpg')
+    photo.resize((2400, 1800)).save(fixtures['jpeg 4MP'], 'JPEG', quality=90)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    fixtures['jpeg 12MP rotated'] = os.path.join(folder, 'photo_rotated.jpg')
+    photo.save(fixtures['jpeg 12MP rotated'], 'JPEG', quality=90, exif=exif.tobytes())
+
+    fixtures['png 4MP'] = os.path.join(folder, 'screenshot.png')
+    photo.resize((2400, 1800)).save(fixtures['png 4MP'], 'PNG')
+    return fixtures
+
+def full_decode(path, size):
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        scale = min(size[0] / image.width, size[1] / image.height)
+        return image.resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.LANCZOS)
+
+def legacy_thumbnail(path, size):
+    with Image.open(path) as image:
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        return image
+
+def timed(fn, path, size, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(path, size)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fixtures = build_fixtures(tempfile.mkdtemp(prefix='lunalink-bench-'))
+    targets = {'thumb 200': (200, 200), 'width 1280': (1280, 1 << 16)}
+
+    print(f"{'fixture':>18} {'target':>11} {'full decode':>12} {'thumbnail()':>12} {'pipeline':>9}  (median ms)")
+    for name, path in fixtures.items():
+        for label, size in targets.items():
+            print(f"{name:>18} {label:>11} "
+                  f"{timed(full_decode, path, size, args.repeat):>12.1f} "
+                  f"{timed(legacy_thumbnail, path, size, args.repeat):>12.1f} "
+                  f"{timed(open_bounded, path, size, args.repeat):>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""On-disk size and page-read latency of the messages table per storage mode.
+
+Usage: python benchmarks/message_storage.py [--messages 20000] [--mode ciphertext]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix='lunalink-bench-')
+DB_PATH = os.path.join(DB_DIR, 'bench.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+if not os.environ.get('ENCRYPTION_KEY'):
+    from cryptography.fernet import Fernet
+    os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+from sqlalchemy import text
+from app import create_app
+from models import db, User, Message, conversation_key_for
+from utils.encryption import encrypt_many
+from utils.message_serializer import with_message_relations, serialize_messages
+from utils.message_storage import compact_message_storage
+
+WORDS = 'love you miss dinner tonight call later sleep well good morning movie weekend coffee'.split()
+
+def seed(count):
+    alice = User(name='Alice', email='alice@bench.local', password_hash='x')
+    bob = User(name='Bob', email='bob@bench.local', password_hash='x')
+    db.session.add_all([alice, bob])
+    db.session.commit()
+
+    key = conversation_key_for(alice.id, bob.id)
+    texts = [' '.join(random.choices(WORDS, k=random.randint(3, 25))) for _ in range(count)]
+    rows = [
+        {
+            'sender_id': alice.id if i % 2 else bob.id,
+            'receiver_id': bob.id if i % 2 else alice.id,
+            'conversation_key': key,
+            'content': body,
+            'encrypted_content': ciphertext,
+            'message_type': 'text'
+        }
+        for i, (body, ciphertext) in enumerate(zip(texts, encrypt_many(texts)))
+    ]
+    db.session.execute(Message.__table__.insert(), rows)
+    db.session.commit()
+    return alice, key
+
+def measure(alice, key, reads=200):
+    db.session.execute(text('VACUUM'))
+    size = os.path.getsize(DB_PATH)
+    users = {alice.id: alice, alice.partner_id: alice.partner} if alice.partner else {alice.id: alice}
+
+    top_id = db.session.query(db.func.max(Message.id)).scalar()
+    start = time.perf_counter()
+    for _ in range(reads):
+        before_id = random.randint(51, top_id)
+        page = with_message_relations(Message.query.filter_by(conversation_key=key), users).filter(
+            Message.id < before_id
+        ).order_by(Message.id.desc()).limit(50).all()
+        serialize_messages(page, users)
+        db.session.expire_all()
+    latency_ms = (time.perf_counter() - start) / reads * 1000
+    return size, latency_ms
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--mode', default='ciphertext', choices=['ciphertext', 'plaintext'])
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        alice, key = seed(args.messages)
+
+        before_size, before_latency = measure(alice, key)
+        compact_message_storage(args.mode, pause=0)
+        after_size, after_latency = measure(alice, key)
+
+    print(f"messages: {args.messages}, dual -> {args.mode}")
+    print(f"on-disk size:      {before_size / 1024:10.0f} KiB -> {after_size / 1024:10.0f} KiB")
+    print(f"50-row page read:  {before_latency:10.2f} ms  -> {after_latency:10.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare chat message throughput: per-message commits vs the group-commit writer.
+
+Usage: python benchmarks/message_writes.py [--messages 2000] [--batch-size 64]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix='lunalink-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+
+from app import create_app, update_chat_streak
+from models import db, Message, conversation_key_for
+from utils.message_writer import message_writer, PendingMessage
+from benchmarks._fixtures import create_couples
+
+def per_message_commits(sender_id, receiver_id, count):
+    """Mirror of the synchronous handle_send_message path"""
+    start = time.perf_counter()
+    for i in range(count):
+        message = Message(
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            conversation_key=conversation_key_for(sender_id, receiver_id),
+            content=f'message {i}',
+            message_type='text'
+        )
+        db.session.add(message)
+        db.session.commit()
+        update_chat_streak(sender_id, receiver_id)
+    return time.perf_counter() - start
+
+def group_commits(sender_id, receiver_id, count, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        batch = [
+            PendingMessage(sender_id, receiver_id, f'message {i}', None, 'text', datetime.utcnow(), None)
+            for i in range(offset, min(offset + batch_size, count))
+        ]
+        message_writer.write_batch(batch)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        [(sender_id, receiver_id)] = create_couples(1)
+
+        sync_seconds = per_message_commits(sender_id, receiver_id, args.messages)
+        batched_seconds = group_commits(sender_id, receiver_id, args.messages, args.batch_size)
+
+    print(f"messages: {args.messages}, batch size: {args.batch_size}")
+    print(f"per-message commit: {args.messages / sync_seconds:10.1f} msg/s")
+    print(f"group commit:       {args.messages / batched_seconds:10.1f} msg/s")
+    print(f"speedup:            {sync_seconds / batched_seconds:10.1f}x")
+
+if __name__ == '__main__':
+    main()
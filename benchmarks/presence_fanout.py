@@ -0,0 +1,60 @@
+"""Presence fanout load test: events delivered per connect as connected users grow.
+
+Connects N couples through the Socket.IO test client, then connects one more
+user and counts how many events every other socket received. With
+partner-scoped fanout this stays at 1 regardless of N.
+
+Usage: python benchmarks/presence_fanout.py [--couples 10 50 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix='lunalink-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+
+from app import create_app, socketio
+from models import db
+from benchmarks._fixtures import create_couples, http_client, members
+
+def connect(app, user_id):
+    return socketio.test_client(app, flask_test_client=http_client(app, user_id))
+
+def events_per_connect(app, couples, offset):
+    with app.app_context():
+        user_ids = members(create_couples(couples, offset))
+
+    # Everyone but the last user connects first
+    clients = [connect(app, user_id) for user_id in user_ids[:-1]]
+    for client in clients:
+        client.get_received()
+
+    late_client = connect(app, user_ids[-1])
+    delivered = sum(len(client.get_received()) for client in clients)
+
+    for client in clients + [late_client]:
+        client.disconnect()
+    return len(clients), delivered
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--couples', type=int, nargs='+', default=[10, 50, 200])
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['PRESENCE_DEBOUNCE_SECONDS'] = 0
+    with app.app_context():
+        db.create_all()
+
+    offset = 0
+    print(f"{'connected sockets':>18} {'events per connect':>19}")
+    for couples in args.couples:
+        connected, delivered = events_per_connect(app, couples, offset)
+        offset += couples
+        print(f"{connected:>18} {delivered:>19}")
+
+if __name__ == '__main__':
+    main()
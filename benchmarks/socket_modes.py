@@ -0,0 +1,128 @@
+"""Socket.IO server mode comparison: connection capacity and message latency.
+
+Starts wsgi.py once per async mode (eventlet, gevent, threading; modes whose
+packages are not installed are skipped), opens up to --clients Socket.IO
+connections as paired users, then times send_message -> message_sent round
+trips from every sender.
+
+Usage: python benchmarks/socket_modes.py [--clients 200] [--messages 20]
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_DIR = tempfile.mkdtemp(prefix='lunalink-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+os.environ.setdefault('SECRET_KEY', 'socket-modes-benchmark')
+if not os.environ.get('ENCRYPTION_KEY'):
+    from cryptography.fernet import Fernet
+    os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+import socketio as socketio_client
+
+from app import create_app
+from models import db
+from benchmarks._fixtures import create_couples, session_cookie, members
+
+MODES = ('eventlet', 'gevent', 'threading')
+PORT = 5099
+
+def available_modes():
+    return [mode for mode in MODES if mode == 'threading' or importlib.util.find_spec(mode)]
+
+def start_server(mode):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=mode, SERVER_PORT=str(PORT), SERVER_WORKERS='1',
+               SERVER_HOST='127.0.0.1', SERVER_ALLOW_DEV_SERVER='true')
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'wsgi.py')], env=env, cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        probe = socketio_client.Client()
+        try:
+            probe.connect(f'http://127.0.0.1:{PORT}', wait_timeout=1)
+            probe.disconnect()
+            return server
+        except Exception:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+def connect_clients(app, user_ids):
+    clients = []
+    for user_id in user_ids:
+        client = socketio_client.Client(reconnection=False)
+        cookie = f"{app.config.get('SESSION_COOKIE_NAME', 'session')}={session_cookie(app, user_id)}"
+        try:
+            client.connect(f'http://127.0.0.1:{PORT}', headers={'Cookie': cookie}, wait_timeout=5)
+        except Exception:
+            break
+        clients.append(client)
+    return clients
+
+def measure_latency(senders, messages):
+    latencies = []
+    lock = threading.Lock()
+
+    def run(client):
+        acked = threading.Event()
+        client.on('message_sent', lambda data: acked.set())
+        for i in range(messages):
+            acked.clear()
+            started = time.perf_counter()
+            client.emit('send_message', {'message': f'ping {i}'})
+            if acked.wait(5):
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=run, args=(client,)) for client in senders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user_ids = members(create_couples(args.clients // 2))
+
+    print(f"{'mode':>10} {'connected':>10} {'msgs':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in available_modes():
+        server = start_server(mode)
+        try:
+            clients = connect_clients(app, user_ids)
+            # Every other client (the A side of each couple) sends
+            latencies = measure_latency(clients[::2], args.messages)
+            for client in clients:
+                client.disconnect()
+        finally:
+            server.terminate()
+            server.wait()
+
+        if latencies:
+            print(f"{mode:>10} {len(clients):>10} {len(latencies):>6} "
+                  f"{statistics.median(latencies):>8.2f} {percentile(latencies, 0.99):>8.2f}")
+        else:
+            print(f"{mode:>10} {len(clients):>10} {0:>6} {'-':>8} {'-':>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Upload and chat latency with thumbnails rendered in the request vs in the process pool.
+
+Runs --uploads image uploads through POST /chat/send-message while --chatters
+couples keep sending socket messages, once with THUMBNAIL_ASYNC off and once
+on, and reports p50/p99 for both. Everything runs in one process, so a resize
+holding the GIL shows up directly in the chat latencies.
+
+Usage: python benchmarks/upload_latency.py [--uploads 20] [--chatters 4] [--size 3000]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_DIR = tempfile.mkdtemp(prefix='lunalink-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+if not os.environ.get('ENCRYPTION_KEY'):
+    from cryptography.fernet import Fernet
+    os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+from PIL import Image
+
+from app import create_app, socketio
+from models import db
+from utils.thumbnail_jobs import thumbnail_jobs
+from benchmarks._fixtures import create_couples, http_client
+
+def sample_jpeg(size):
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 60).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+def percentiles(values):
+    ordered = sorted(values)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+def run(app, couples, uploads, image):
+    stop = threading.Event()
+    chat_latencies = []
+    upload_latencies = []
+
+    def chatter(user_id):
+        client = socketio.test_client(app, flask_test_client=http_client(app, user_id))
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.emit('send_message', {'message': 'hello'})
+            chat_latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+        client.disconnect()
+
+    def uploader(user_id):
+        client = http_client(app, user_id)
+        for i in range(uploads):
+            started = time.perf_counter()
+            client.post('/chat/send-message', data={
+                'message': f'photo {i}', 'type': 'image', 'file': (io.BytesIO(image), 'photo.jpg')
+            })
+            upload_latencies.append((time.perf_counter() - started) * 1000)
+
+    chatters = [threading.Thread(target=chatter, args=(a,)) for a, _ in couples[1:]]
+    for thread in chatters:
+        thread.start()
+    uploader(couples[0][0])
+    stop.set()
+    for thread in chatters:
+        thread.join()
+    return percentiles(upload_latencies), percentiles(chat_latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--chatters', type=int, default=4)
+    parser.add_argument('--size', type=int, default=3000, help='image edge in pixels')
+    args = parser.parse_args()
+
+    # Uploads land under ./instance/media; keep them in the scratch directory
+    os.chdir(DB_DIR)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+
+    image = sample_jpeg(args.size)
+    print(f"{'thumbnails':>12} {'upload p50':>11} {'upload p99':>11} {'chat p50':>9} {'chat p99':>9}  (ms)")
+    offset = 0
+    for async_thumbnails in (False, True):
+        app.config['THUMBNAIL_ASYNC'] = async_thumbnails
+        with app.app_context():
+            couples = create_couples(args.chatters + 1, offset)
+        offset += args.chatters + 1
+
+        (upload_p50, upload_p99), (chat_p50, chat_p99) = run(app, couples, args.uploads, image)
+        label = 'pool' if async_thumbnails else 'in request'
+        print(f"{label:>12} {upload_p50:>11.1f} {upload_p99:>11.1f} {chat_p50:>9.1f} {chat_p99:>9.1f}")
+
+    thumbnail_jobs.shutdown()
+
+if __name__ == '__main__':
+    main()
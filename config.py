@@ -28,5 +28,67 @@ class Config:
     UPLOAD_FOLDER = 'static/uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'mp3', 'wav'}
     
+    # Resumable chunked uploads (utils/chunked_upload.py); each chunk stays under MAX_CONTENT_LENGTH
+    UPLOAD_STAGING_FOLDER = 'instance/upload_staging'
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 200 * 1024 * 1024))
+    UPLOAD_STAGING_MAX_AGE_SECONDS = 24 * 60 * 60
+    
+    # Thumbnails and media metadata in a process pool (utils/thumbnail_jobs.py); False does both in the request
+    THUMBNAIL_ASYNC = os.environ.get('THUMBNAIL_ASYNC', 'true').lower() == 'true'
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_MAX_PENDING = 32
+    
+    # Content-addressed media blobs (utils/blob_store.py), kept out of static/ and served only by /chat/download
+    MEDIA_ROOT = os.environ.get('MEDIA_ROOT', 'instance/media')
+    # 'sharded' stores files under <kind>/ab/cd/, 'flat' directly in <kind>/ (utils/media_storage.py)
+    MEDIA_LAYOUT = os.environ.get('MEDIA_LAYOUT', 'sharded')
+    # Downloads: '' streams from Python, 'x-accel' (nginx) or 'x-sendfile' hands the bytes to the proxy
+    MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media')  # nginx 'internal' location aliased to MEDIA_ROOT
+    MEDIA_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+    BLOB_GC_INTERVAL_SECONDS = 6 * 60 * 60
+    BLOB_GC_GRACE_SECONDS = 60 * 60
+    
+    # On-demand image renditions (utils/renditions.py), LRU-evicted past the byte budget
+    RENDITION_CACHE_FOLDER = 'instance/renditions'
+    RENDITION_CACHE_MAX_BYTES = int(os.environ.get('RENDITION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    RENDITION_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+    
+    # Server (see wsgi.py): 'eventlet', 'gevent' or 'threading'; unset auto-detects
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or None
+    SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('SERVER_PORT', 5000))
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))  # >1 requires SOCKETIO_MESSAGE_QUEUE
+    SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS', 1024))
+    # wsgi.py refuses threading mode (Werkzeug's development server) unless this is set
+    SERVER_ALLOW_DEV_SERVER = os.environ.get('SERVER_ALLOW_DEV_SERVER', 'false').lower() == 'true'
+    SOCKETIO_PING_INTERVAL = int(os.environ.get('SOCKETIO_PING_INTERVAL', 25))
+    SOCKETIO_PING_TIMEOUT = int(os.environ.get('SOCKETIO_PING_TIMEOUT', 20))
+    SOCKETIO_MAX_HTTP_BUFFER_SIZE = 1000000
+    
+    # Realtime
+    # redis://host:6379/0 in production; local://127.0.0.1:6390 for the in-repo broker (utils/local_pubsub.py)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    PRESENCE_FLUSH_INTERVAL_SECONDS = 30
+    PRESENCE_DEBOUNCE_SECONDS = float(os.environ.get('PRESENCE_DEBOUNCE_SECONDS', 5))
+    READ_RECEIPT_DEBOUNCE_SECONDS = 0.5
+    TYPING_TIMEOUT_SECONDS = 5
+    TYPING_STOP_GRACE_SECONDS = 1
+    TYPING_SWEEP_INTERVAL_SECONDS = 0.5
+    
+    # Group-commit chat messages from a single background writer
+    MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', 'false').lower() == 'true'
+    MESSAGE_BATCH_SIZE = 64
+    MESSAGE_BATCH_INTERVAL_SECONDS = 0.005
+    
+    # Identity cache for load_user (per process)
+    IDENTITY_CACHE_SIZE = 1024
+    IDENTITY_CACHE_TTL_SECONDS = 60
+    
+    # Message bodies: 'dual' (plaintext + ciphertext), 'ciphertext' or 'plaintext'
+    MESSAGE_STORAGE_MODE = os.environ.get('MESSAGE_STORAGE_MODE', 'dual')
+    
     # Encryption
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or 'your-encryption-key-32-bytes'
\ No newline at end of file
@@ -15,6 +15,11 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor.execute("PRAGMA foreign_keys=ON;")
         cursor.close()
 
+def conversation_key_for(user_a_id, user_b_id):
+    """Normalized key shared by both directions of a couple's conversation"""
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return f"{low}:{high}"
+
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     
@@ -109,6 +114,7 @@ class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    conversation_key = db.Column(db.String(32))  # "<low_id>:<high_id>", see conversation_key_for
     content = db.Column(db.Text, nullable=False)
     message_type = db.Column(db.String(20), default='text')  # 'text', 'image', 'video', 'voice'
     encrypted_content = db.Column(db.Text)  # For E2EE
@@ -120,6 +126,25 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
     media = db.relationship('Media', backref='message', lazy=True, cascade='all, delete-orphan')
+    
+    @property
+    def text(self):
+        """Plaintext body, decrypted lazily when only the ciphertext is stored"""
+        if self.content or not self.encrypted_content:
+            return self.content
+        from utils.encryption import decrypt_message
+        return decrypt_message(self.encrypted_content)
+    
+    __table_args__ = (
+        db.Index('ix_messages_conversation_timestamp', 'conversation_key', 'timestamp'),
+        db.Index('ix_messages_conversation_id', 'conversation_key', 'id'),
+        db.Index('ix_messages_receiver_unread', 'receiver_id', 'is_read', 'sender_id'),
+    )
+
+@event.listens_for(Message, 'before_insert')
+def set_conversation_key(mapper, connection, target):
+    if target.conversation_key is None and target.sender_id and target.receiver_id:
+        target.conversation_key = conversation_key_for(target.sender_id, target.receiver_id)
 
 class Media(db.Model):
     __tablename__ = 'media'
@@ -131,6 +156,49 @@ class Media(db.Model):
     file_size = db.Column(db.Integer)
     thumbnail_path = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Content-addressed blob holding the bytes (utils/blob_store.py); NULL for pre-dedup uploads
+    blob_digest = db.Column(db.String(64), db.ForeignKey('media_blobs.digest'), nullable=True, index=True)
+    
+    # Layout metadata filled in after upload (utils/media_metadata.py); NULL until extracted
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    duration = db.Column(db.Float)
+    dominant_color = db.Column(db.String(7))
+    placeholder = db.Column(db.String(512))
+
+class MediaBlob(db.Model):
+    """One stored file per distinct SHA-256, shared by every Media row with those bytes"""
+    __tablename__ = 'media_blobs'
+    
+    digest = db.Column(db.String(64), primary_key=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_type = db.Column(db.String(50), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    thumbnail_path = db.Column(db.String(500))
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    duration = db.Column(db.Float)
+    dominant_color = db.Column(db.String(7))
+    placeholder = db.Column(db.String(512))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+@event.listens_for(Media, 'after_insert')
+def _reference_blob(mapper, connection, media):
+    if media.blob_digest:
+        connection.execute(
+            MediaBlob.__table__.update().where(MediaBlob.digest == media.blob_digest)
+            .values(ref_count=MediaBlob.ref_count + 1)
+        )
+
+@event.listens_for(Media, 'after_delete')
+def _release_blob(mapper, connection, media):
+    if media.blob_digest:
+        connection.execute(
+            MediaBlob.__table__.update().where(MediaBlob.digest == media.blob_digest)
+            .values(ref_count=MediaBlob.ref_count - 1)
+        )
 
 class Anniversary(db.Model):
     __tablename__ = 'anniversaries'
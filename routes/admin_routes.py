@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from functools import wraps
 
 from models import db, User, Message, Media
+from utils.message_storage import STORAGE_MODES, compact_message_storage
+from utils.identity_cache import identity_cache
+from utils.blob_store import dedup_stats, collect_garbage
+from utils.media_storage import migrate_media_layout
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -36,6 +40,7 @@ def admin_dashboard():
                          total_users=total_users,
                          total_messages=total_messages,
                          total_media=total_media,
+                         media_dedup=dedup_stats(),
                          today_messages=today_messages,
                          recent_users=recent_users,
                          recent_messages=recent_messages)
@@ -71,4 +76,52 @@ def backup_database():
     import shutil
     shutil.copy2('instance/lunalink.db', f'backups/{backup_file}')
     
-    return jsonify({'success': True, 'backup_file': backup_file})
\ No newline at end of file
+    return jsonify({'success': True, 'backup_file': backup_file})
+
+@admin_bp.route('/compact-messages', methods=['POST'])
+@login_required
+@admin_required
+def compact_messages():
+    """Start an online rewrite of stored message bodies to the configured storage mode"""
+    mode = (request.get_json(silent=True) or {}).get('mode') or current_app.config.get('MESSAGE_STORAGE_MODE', 'dual')
+    if mode not in STORAGE_MODES:
+        return jsonify({'error': f'Unknown storage mode: {mode}'}), 400
+    
+    app = current_app._get_current_object()
+    
+    def run_compaction():
+        with app.app_context():
+            compact_message_storage(mode)
+    
+    app.extensions['socketio'].start_background_task(run_compaction)
+    
+    return jsonify({'success': True, 'mode': mode})
+
+@admin_bp.route('/identity-cache')
+@login_required
+@admin_required
+def identity_cache_stats():
+    return jsonify(identity_cache.stats())
+
+@admin_bp.route('/collect-media', methods=['POST'])
+@login_required
+@admin_required
+def collect_media():
+    """Delete media blobs that no message references any more"""
+    removed, freed = collect_garbage(current_app.config.get('BLOB_GC_GRACE_SECONDS', 3600))
+    return jsonify({'success': True, 'removed': removed, 'bytes_freed': freed})
+
+@admin_bp.route('/migrate-media-layout', methods=['POST'])
+@login_required
+@admin_required
+def migrate_media():
+    """Start an online move of stored media files into the configured MEDIA_LAYOUT"""
+    app = current_app._get_current_object()
+    
+    def run_migration():
+        with app.app_context():
+            migrate_media_layout()
+    
+    app.extensions['socketio'].start_background_task(run_migration)
+    
+    return jsonify({'success': True, 'layout': app.config.get('MEDIA_LAYOUT', 'sharded')})
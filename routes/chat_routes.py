@@ -1,16 +1,36 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, current_app, render_template, request, jsonify, send_file
 from flask_login import login_required, current_user
 from flask_socketio import emit
 from datetime import datetime, timedelta
 import os
 from werkzeug.utils import secure_filename
 
-from models import db, Message, Media, User
+from models import db, Message, Media, User, conversation_key_for
 from utils.email_sender import send_invitation_email, test_email_configuration
-from utils.file_handler import allowed_file, save_media_file, generate_image_thumbnail
+from utils.file_handler import allowed_file, blob_files, get_file_type_for_name
+from utils.blob_store import store_upload, put_blob
+from utils.chunked_upload import (
+    UploadError, start_upload, load_upload, append_chunk, finish_upload, discard_upload
+)
+from utils.message_serializer import (
+    with_message_relations, conversation_users, serialize_message, serialize_messages, serialize_gallery_item
+)
+from utils.read_receipts import mark_messages_read, notify_messages_read
+from utils.message_storage import message_body_fields
+from utils.typing_relay import typing_relay
+from utils.thumbnail_jobs import thumbnail_jobs
+from utils.renditions import RENDITION_FORMATS, rendition_cache, snap_width
+from utils.media_storage import media_storage
+from utils.media_metadata import copy_metadata
 
 chat_bp = Blueprint('chat', __name__)
 
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_LIMIT = 100
+GALLERY_PAGE_SIZE = 60
+GALLERY_PAGE_LIMIT = 200
+GALLERY_KINDS = ('image', 'video', 'audio')
+
 @chat_bp.route('/')
 @login_required
 def chat_room():
@@ -18,23 +38,17 @@ def chat_room():
     if not partner:
         return render_template('chat/chat.html', partner=None, messages=[])
     
-    # Get last 50 messages
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == partner.id)) |
-        ((Message.sender_id == partner.id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).limit(50).all()
-    
-    # Mark messages as read
-    unread_messages = Message.query.filter_by(
-        receiver_id=current_user.id, 
-        sender_id=partner.id, 
-        is_read=False
-    ).all()
+    # Newest page straight off the (conversation_key, id) index, then back to chronological order
+    messages = with_message_relations(Message.query, conversation_users(current_user)).filter_by(
+        conversation_key=conversation_key_for(current_user.id, partner.id)
+    ).order_by(Message.id.desc()).limit(MESSAGES_PAGE_SIZE).all()
+    messages.reverse()
     
-    for msg in unread_messages:
-        msg.is_read = True
-    
-    db.session.commit()
+    # Mark messages as read with a single UPDATE rather than loading every unread row
+    first_read_id, last_read_id, read_count = mark_messages_read(current_user.id, partner.id)
+    if read_count:
+        notify_messages_read(current_app.extensions['socketio'], current_user.id, partner.id,
+                             last_read_id, first_read_id, last_read_id, read_count)
     
     return render_template('chat/chat.html', partner=partner, messages=messages)
 
@@ -54,45 +68,138 @@ def send_message():
     new_message = Message(
         sender_id=current_user.id,
         receiver_id=partner.id,
-        content=content,
+        conversation_key=conversation_key_for(current_user.id, partner.id),
         message_type=message_type,
+        **message_body_fields(content),
         timestamp=datetime.utcnow()
     )
     
     # Handle file upload
+    media = None
     if 'file' in request.files:
         file = request.files['file']
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path, thumbnail_path = save_media_file(file, filename)
-            
-            media = Media(
-                message=new_message,
-                file_path=file_path,
-                file_type=file.content_type,
-                file_size=os.path.getsize(file_path),
-                thumbnail_path=thumbnail_path
-            )
+            blob, created = store_upload(file, filename)
+            media = media_from_blob(new_message, blob, created, file_type=file.content_type)
             db.session.add(media)
     
     db.session.add(new_message)
     db.session.commit()
+    if media is not None:
+        queue_processing(media, created)
     
     # Emit SocketIO event
-    message_data = {
-        'id': new_message.id,
-        'sender_id': current_user.id,
-        'sender_name': current_user.name,
-        'content': content,
-        'type': message_type,
-        'timestamp': new_message.timestamp.isoformat(),
-        'avatar': current_user.avatar
-    }
+    message_data = serialize_message(new_message, conversation_users(current_user))
     
     emit('new_message', message_data, room=f'user_{partner.id}', namespace='/')
     
     return jsonify({'success': True, 'message': message_data})
 
+def media_from_blob(message, blob, created, file_type=None):
+    """Media row on a stored blob; known bytes reuse the blob's file, thumbnail and metadata"""
+    file_path, thumbnail_path = blob_files(blob, created, thumbnail=not thumbnail_jobs.enabled)
+    media = Media(
+        message=message,
+        file_path=file_path,
+        file_type=file_type or blob.file_type,
+        file_size=blob.size,
+        thumbnail_path=thumbnail_path,
+        blob_digest=blob.digest
+    )
+    copy_metadata(blob, media)
+    return media
+
+def queue_processing(media, created):
+    """Hand committed media with new bytes to the pool for thumbnail and metadata; media_ready follows"""
+    if created and thumbnail_jobs.enabled:
+        thumbnail_jobs.submit(media.id, media.file_path, media.file_type)
+
+@chat_bp.errorhandler(UploadError)
+def upload_error(error):
+    return jsonify({'error': str(error), **error.details}), error.status
+
+@chat_bp.route('/uploads', methods=['POST'])
+@login_required
+def init_upload():
+    """Start a resumable upload; the client then PUTs chunks and commits"""
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'File size required'}), 400
+    
+    state = start_upload(current_user.id, filename, size, data.get('sha256'))
+    return jsonify({
+        'upload_id': state['upload_id'],
+        'offset': state['offset'],
+        'chunk_size': current_app.config.get('UPLOAD_CHUNK_SIZE', 1024 * 1024)
+    }), 201
+
+@chat_bp.route('/uploads/<upload_id>')
+@login_required
+def upload_status(upload_id):
+    """Where to resume: bytes already staged"""
+    state = load_upload(upload_id, current_user.id)
+    return jsonify({'upload_id': upload_id, 'offset': state['offset'], 'size': state['size']})
+
+@chat_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Append the raw request body at ?offset=, streamed straight to the staging file"""
+    state = load_upload(upload_id, current_user.id)
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'offset required', 'offset': state['offset']}), 400
+    
+    new_offset = append_chunk(
+        state, offset, request.stream, request.content_length,
+        checksum=request.headers.get('X-Chunk-SHA256')
+    )
+    return jsonify({'upload_id': upload_id, 'offset': new_offset, 'size': state['size']})
+
+@chat_bp.route('/uploads/<upload_id>/commit', methods=['POST'])
+@login_required
+def commit_upload(upload_id):
+    """Verify the assembled file and turn it into a media message"""
+    partner = current_user.partner
+    if not partner:
+        return jsonify({'error': 'No partner linked'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    state = load_upload(upload_id, current_user.id)
+    staged_path, digest = finish_upload(state)
+    blob, created = put_blob(staged_path, digest, state['size'], state['filename'])
+    
+    new_message = Message(
+        sender_id=current_user.id,
+        receiver_id=partner.id,
+        conversation_key=conversation_key_for(current_user.id, partner.id),
+        message_type=data.get('type', 'file'),
+        **message_body_fields(data.get('message') or ''),
+        timestamp=datetime.utcnow()
+    )
+    media = media_from_blob(new_message, blob, created, file_type=get_file_type_for_name(state['filename']))
+    db.session.add_all([new_message, media])
+    db.session.commit()
+    queue_processing(media, created)
+    
+    message_data = serialize_message(new_message, conversation_users(current_user))
+    emit('new_message', message_data, room=f'user_{partner.id}', namespace='/')
+    
+    return jsonify({'success': True, 'message': message_data})
+
+@chat_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    load_upload(upload_id, current_user.id)
+    discard_upload(upload_id)
+    return jsonify({'success': True})
+
 @chat_bp.route('/messages')
 @login_required
 def get_messages():
@@ -100,83 +207,159 @@ def get_messages():
     if not partner_id:
         return jsonify({'error': 'Partner ID required'}), 400
     
-    page = request.args.get('page', 1, type=int)
-    per_page = 50
-    
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == partner_id)) |
-        ((Message.sender_id == partner_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    messages_data = []
-    for msg in messages.items[::-1]:  # Reverse to get chronological order
-        message_data = {
-            'id': msg.id,
-            'sender_id': msg.sender_id,
-            'sender_name': msg.sender.name,
-            'content': msg.content,
-            'type': msg.message_type,
-            'timestamp': msg.timestamp.isoformat(),
-            'is_read': msg.is_read,
-            'avatar': msg.sender.avatar
-        }
-        
-        if msg.media:
-            media = msg.media[0]
-            message_data['media'] = {
-                'file_path': media.file_path,
-                'file_type': media.file_type,
-                'thumbnail_path': media.thumbnail_path
-            }
-        
-        messages_data.append(message_data)
+    try:
+        conversation_key = conversation_key_for(current_user.id, partner_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid partner ID'}), 400
+    
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = min(max(request.args.get('limit', MESSAGES_PAGE_SIZE, type=int), 1), MESSAGES_PAGE_LIMIT)
+    
+    # Keyset pagination: seek on (conversation_key, id) instead of OFFSET/COUNT.
+    # One extra row is fetched to know whether another page exists.
+    users = conversation_users(current_user, partner_id)
+    query = with_message_relations(Message.query.filter_by(conversation_key=conversation_key), users)
+    if after_id is not None:
+        rows = query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        page_messages = rows[:limit]
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        page_messages = rows[:limit][::-1]  # Reverse to get chronological order
+    
+    # Forward reads hand back the newest id seen; backward reads the oldest
+    if after_id is not None:
+        next_cursor = page_messages[-1].id if page_messages else after_id
+    else:
+        next_cursor = page_messages[0].id if has_more else None
     
     return jsonify({
-        'messages': messages_data,
-        'has_next': messages.has_next,
-        'has_prev': messages.has_prev
+        'messages': serialize_messages(page_messages, users),
+        'next_cursor': next_cursor,
+        'has_more': has_more
     })
 
+def gallery_buckets(conversation_key, kind=None):
+    """Media counts per month, newest first, split by kind, from one aggregate query"""
+    year = db.extract('year', Message.timestamp)
+    month = db.extract('month', Message.timestamp)
+    rows = db.session.query(year, month, Media.file_type, db.func.count(Media.id)).join(
+        Message, Media.message_id == Message.id
+    ).filter(Message.conversation_key == conversation_key).group_by(year, month, Media.file_type).all()
+    
+    buckets = {}
+    for row_year, row_month, file_type, count in rows:
+        key = f"{int(row_year):04d}-{int(row_month):02d}"
+        bucket = buckets.setdefault(key, {'month': key, 'count': 0, 'image': 0, 'video': 0, 'audio': 0, 'other': 0})
+        file_kind = file_type.split('/')[0]
+        if file_kind not in GALLERY_KINDS:
+            file_kind = 'other'
+        bucket[file_kind] += count
+        if kind is None or file_kind == kind:
+            bucket['count'] += count
+    
+    return [bucket for _, bucket in sorted(buckets.items(), reverse=True) if bucket['count']]
+
 @chat_bp.route('/media')
 @login_required
 def get_media():
+    """One page of the couple's media, newest first; the first page also carries per-month counts.
+
+    ?type=image|video|audio filters, ?cursor= takes the previous page's next_cursor.
+    """
     partner = current_user.partner
     if not partner:
         return jsonify({'error': 'No partner linked'}), 400
     
-    media_messages = Message.query.join(Media).filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == partner.id)) |
-        ((Message.sender_id == partner.id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.desc()).all()
-    
-    media_data = []
-    for msg in media_messages:
-        if msg.media:
-            for media in msg.media:
-                media_data.append({
-                    'id': media.id,
-                    'message_id': msg.id,
-                    'file_path': media.file_path,
-                    'file_type': media.file_type,
-                    'thumbnail_path': media.thumbnail_path,
-                    'timestamp': msg.timestamp.isoformat(),
-                    'sender_name': msg.sender.name
-                })
-    
-    return jsonify({'media': media_data})
+    kind = request.args.get('type')
+    if kind in (None, '', 'all'):
+        kind = None
+    elif kind not in GALLERY_KINDS:
+        return jsonify({'error': f'Unknown media type: {kind}'}), 400
+    cursor = request.args.get('cursor', type=int)
+    limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1), GALLERY_PAGE_LIMIT)
+    conversation_key = conversation_key_for(current_user.id, partner.id)
+    
+    # Keyset pagination on media id, fetching one extra row to know whether another page exists
+    users = conversation_users(current_user)
+    query = db.session.query(Media, Message).join(Message, Media.message_id == Message.id).filter(
+        Message.conversation_key == conversation_key
+    )
+    if kind:
+        query = query.filter(Media.file_type.like(f'{kind}/%'))
+    if cursor is not None:
+        query = query.filter(Media.id < cursor)
+    rows = query.order_by(Media.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    response = {
+        'media': [serialize_gallery_item(media, message, users) for media, message in rows],
+        'next_cursor': rows[-1][0].id if has_more else None,
+        'has_more': has_more
+    }
+    if cursor is None:
+        response['buckets'] = gallery_buckets(conversation_key, kind)
+    return jsonify(response)
 
 @chat_bp.route('/download/<int:media_id>')
 @login_required
 def download_media(media_id):
+    """Original file as an attachment, or inline with ?inline=1 (gallery players seek with Range)"""
     media = Media.query.get_or_404(media_id)
     
     # Check if user has permission to access this media
     if media.message.sender_id != current_user.id and media.message.receiver_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    return send_file(media.file_path, as_attachment=True)
+    if not media_storage.exists(media.file_path):
+        return jsonify({'error': 'File not found'}), 404
+    
+    return media_storage.send(
+        media.file_path,
+        mimetype=media.file_type,
+        as_attachment=request.args.get('inline') != '1',
+        etag=media.blob_digest or True
+    )
+
+@chat_bp.route('/media/<int:media_id>/rendition')
+@login_required
+def media_rendition(media_id):
+    """Resized image at ?w= (snapped to a fixed ladder) as JPEG or WebP, cached on disk"""
+    media = Media.query.get_or_404(media_id)
+    
+    # Same permission check as download_media
+    if media.message.sender_id != current_user.id and media.message.receiver_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if not media.file_type.startswith('image/') or not os.path.exists(media.file_path):
+        return jsonify({'error': 'No rendition for this media'}), 404
+    
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'webp' if 'image/webp' in request.accept_mimetypes else 'jpeg'
+    if fmt not in RENDITION_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    width = snap_width(request.args.get('w', 640, type=int))
+    
+    # Answer revalidations from the original's stat alone, before any rendering
+    etag = rendition_cache.etag_for(media, width, fmt)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        path, etag = rendition_cache.get(media, width, fmt)
+        response = send_file(media_storage.local_path(path), mimetype=RENDITION_FORMATS[fmt][1], conditional=False, etag=False)
+    
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('RENDITION_MAX_AGE_SECONDS', 7 * 24 * 60 * 60)
+    response.vary.add('Accept')
+    return response
 
 @chat_bp.route('/delete-message/<int:message_id>', methods=['DELETE'])
 @login_required
@@ -257,16 +440,12 @@ def debug_email():
 @chat_bp.route('/typing', methods=['POST'])
 @login_required
 def typing():
-    partner = current_user.partner
-    if not partner:
+    if not current_user.partner_id:
         return jsonify({'error': 'No partner linked'}), 400
     
-    is_typing = request.json.get('typing', False)
-    
-    emit('user_typing', {
-        'user_id': current_user.id,
-        'user_name': current_user.name,
-        'typing': is_typing
-    }, room=f'user_{partner.id}', namespace='/')
+    if request.json.get('typing', False):
+        typing_relay.start(current_user.id, current_user.partner_id, current_user.name)
+    else:
+        typing_relay.stop(current_user.id)
     
     return jsonify({'success': True})
\ No newline at end of file
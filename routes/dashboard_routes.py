@@ -1,11 +1,13 @@
 import os
-from flask import Blueprint, flash, redirect, render_template, request, jsonify, url_for
+from flask import Blueprint, current_app, flash, redirect, render_template, request, jsonify, url_for
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 import requests
 import random
 
-from models import Message, db, User, Anniversary, Note, Mood, ChatStreak, UserSettings
+from models import Message, db, User, Anniversary, Note, Mood, UserSettings, conversation_key_for
+from utils.message_serializer import with_message_relations, conversation_users, serialize_memory
+from utils.streaks import streak_service
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -25,7 +27,7 @@ ROMANTIC_QUOTES = [
 @login_required
 def dashboard():
     partner = current_user.partner
-    streak = ChatStreak.query.filter_by(couple_id=current_user.id).first()
+    streak = streak_service.get_streak(current_user.id, partner.id) if partner else None
     
     # Get today's romantic quote
     today_quote = random.choice(ROMANTIC_QUOTES)
@@ -86,31 +88,15 @@ def memories():
         return render_template('dashboard/memories.html', memories=[])
     
     # Get all messages between the couple (for memory timeline)
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == partner.id)) |
-        ((Message.sender_id == partner.id) & (Message.receiver_id == current_user.id))
+    users = conversation_users(current_user)
+    messages = with_message_relations(Message.query, users).filter_by(
+        conversation_key=conversation_key_for(current_user.id, partner.id)
     ).order_by(Message.timestamp.desc()).limit(100).all()
     
     memories_data = []
     for msg in messages:
         if not msg.is_deleted:
-            memory = {
-                'id': msg.id,
-                'type': 'message',
-                'content': msg.content,
-                'timestamp': msg.timestamp,
-                'sender': msg.sender.name,
-                'sender_avatar': msg.sender.avatar
-            }
-            
-            if msg.media:
-                memory['type'] = 'media'
-                memory['media'] = {
-                    'file_path': msg.media[0].file_path,
-                    'file_type': msg.media[0].file_type
-                }
-            
-            memories_data.append(memory)
+            memories_data.append(serialize_memory(msg, users))
     
     return render_template('dashboard/memories.html', memories=memories_data)
 
@@ -209,7 +195,7 @@ def add_mood():
     # Notify partner via SocketIO if online
     partner = current_user.partner
     if partner:
-        from app import socketio
+        socketio = current_app.extensions['socketio']
         socketio.emit('mood_update', {
             'user_id': current_user.id,
             'user_name': current_user.name,
@@ -415,7 +401,7 @@ def send_virtual_hug():
         return jsonify({'error': 'No partner linked'}), 400
     
     # Send virtual hug notification to partner
-    from app import socketio
+    socketio = current_app.extensions['socketio']
     socketio.emit('virtual_hug', {
         'from_user_id': current_user.id,
         'from_user_name': current_user.name,
@@ -4,6 +4,14 @@ let typingTimer;
 let isRecording = false;
 let mediaRecorder;
 let audioChunks = [];
+let historyCursor = null;
+let isLoadingHistory = false;
+let lastAckedMessageId = 0;
+
+const MESSAGES_PAGE_SIZE = 50;
+// Files above this go through the resumable chunked upload API
+const CHUNKED_UPLOAD_THRESHOLD = 4 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
 
 function initializeChat() {
   // Connect to SocketIO
@@ -18,6 +26,11 @@ function initializeChat() {
     addMessage(data, "received");
     playNotificationSound();
     scrollToBottom();
+    acknowledgeMessages(data.id);
+  });
+
+  socket.on("messages_read", function (data) {
+    markSentMessagesRead(data.up_to_id);
   });
 
   socket.on("user_typing", function (data) {
@@ -60,6 +73,52 @@ function initializeChat() {
   socket.on("error", function (data) {
     showNotification(data.message, "error");
   });
+
+  // Thumbnail and layout metadata finished in the background
+  socket.on("media_ready", function (data) {
+    document
+      .querySelectorAll(`img[data-media-id="${data.media_id}"]`)
+      .forEach((img) => applyMediaLayout(img, data));
+  });
+}
+
+// Size and paint an image slot from upload metadata before the bytes arrive.
+// maxWidth matches the rendition width requested for the slot.
+function mediaDisplaySize(media, maxWidth) {
+  if (!media.width || !media.height) return null;
+  const width = Math.min(media.width, maxWidth);
+  return { width, height: Math.round((media.height * width) / media.width) };
+}
+
+function mediaBackground(media) {
+  const placeholder = media.placeholder
+    ? `url('${media.placeholder}') center / cover no-repeat`
+    : "";
+  return [media.dominant_color, placeholder].filter(Boolean).join(" ");
+}
+
+function mediaLayoutAttrs(media, maxWidth) {
+  let attrs = `data-media-id="${media.id}" data-max-width="${maxWidth}"`;
+  const size = mediaDisplaySize(media, maxWidth);
+  if (size) {
+    attrs += ` width="${size.width}" height="${size.height}"`;
+  }
+  attrs += ` style="max-width: 100%; height: auto; background: ${
+    mediaBackground(media) || "transparent"
+  }"`;
+  return attrs;
+}
+
+function applyMediaLayout(img, metadata) {
+  const size = mediaDisplaySize(metadata, Number(img.dataset.maxWidth));
+  if (size) {
+    img.setAttribute("width", size.width);
+    img.setAttribute("height", size.height);
+  }
+  const background = mediaBackground(metadata);
+  if (background) {
+    img.style.background = background;
+  }
 }
 
 // NEW: Partner connection notification
@@ -202,10 +261,11 @@ function loadMessages() {
   const container = document.getElementById("messagesContainer");
   const loading = document.getElementById("messagesLoading");
 
-  fetch(`/chat/messages?partner_id=${PARTNER_ID}`)
+  fetch(`/chat/messages?partner_id=${PARTNER_ID}&limit=${MESSAGES_PAGE_SIZE}`)
     .then((response) => response.json())
     .then((data) => {
       loading.style.display = "none";
+      historyCursor = data.next_cursor;
 
       if (data.messages && data.messages.length > 0) {
         data.messages.forEach((message) => {
@@ -215,6 +275,7 @@ function loadMessages() {
           );
         });
         scrollToBottom();
+        acknowledgeMessages(data.messages[data.messages.length - 1].id);
       } else {
         container.innerHTML = `
                     <div class="no-messages">
@@ -224,6 +285,8 @@ function loadMessages() {
                     </div>
                 `;
       }
+
+      container.addEventListener("scroll", handleMessagesScroll);
     })
     .catch((error) => {
       console.error("Error loading messages:", error);
@@ -232,7 +295,68 @@ function loadMessages() {
     });
 }
 
-function addMessage(messageData, type) {
+// Read receipts: ack the newest message seen; the server coalesces bursts
+function acknowledgeMessages(upToId) {
+  if (!socket || !upToId || upToId <= lastAckedMessageId) return;
+  if (document.visibilityState !== "visible") return;
+
+  lastAckedMessageId = upToId;
+  socket.emit("mark_read", { up_to_id: upToId });
+}
+
+function markSentMessagesRead(upToId) {
+  document
+    .querySelectorAll("#messagesContainer .message.sent:not(.read)")
+    .forEach((element) => {
+      if (!upToId || Number(element.dataset.messageId) <= upToId) {
+        element.classList.add("read");
+      }
+    });
+}
+
+function handleMessagesScroll() {
+  const container = document.getElementById("messagesContainer");
+  if (container.scrollTop < 100) {
+    loadOlderMessages();
+  }
+}
+
+function loadOlderMessages() {
+  if (!historyCursor || isLoadingHistory) return;
+  isLoadingHistory = true;
+
+  const container = document.getElementById("messagesContainer");
+
+  fetch(
+    `/chat/messages?partner_id=${PARTNER_ID}&before_id=${historyCursor}&limit=${MESSAGES_PAGE_SIZE}`
+  )
+    .then((response) => response.json())
+    .then((data) => {
+      historyCursor = data.next_cursor;
+
+      // Keep the viewport anchored on the message the user was reading
+      const previousHeight = container.scrollHeight;
+      (data.messages || [])
+        .slice()
+        .reverse()
+        .forEach((message) => {
+          addMessage(
+            message,
+            message.sender_id == CURRENT_USER_ID ? "sent" : "received",
+            true
+          );
+        });
+      container.scrollTop += container.scrollHeight - previousHeight;
+    })
+    .catch((error) => {
+      console.error("Error loading older messages:", error);
+    })
+    .finally(() => {
+      isLoadingHistory = false;
+    });
+}
+
+function addMessage(messageData, type, prepend = false) {
   const container = document.getElementById("messagesContainer");
 
   // Remove no messages placeholder if it exists
@@ -243,6 +367,10 @@ function addMessage(messageData, type) {
 
   const messageElement = document.createElement("div");
   messageElement.className = `message ${type}`;
+  messageElement.dataset.messageId = messageData.id;
+  if (type === "sent" && messageData.is_read) {
+    messageElement.classList.add("read");
+  }
 
   const timestamp = new Date(messageData.timestamp).toLocaleTimeString([], {
     hour: "2-digit",
@@ -262,13 +390,10 @@ function addMessage(messageData, type) {
     contentHtml = `
             <div class="media-message">
                 <div class="media-content" onclick="openMedia('${
-                  messageData.media.file_path
+                  messageData.media.url
                 }')">
-                    <img src="${
-                      messageData.media.thumbnail_path ||
-                      messageData.media.file_path
-                    }" 
-                         alt="Shared image">
+                    <img src="/chat/media/${messageData.media.id}/rendition?w=640"
+                         alt="Shared image" loading="lazy" ${mediaLayoutAttrs(messageData.media, 640)}>
                 </div>
                 <div class="message-time">${timestamp}</div>
             </div>
@@ -276,9 +401,9 @@ function addMessage(messageData, type) {
   } else if (messageData.type === "video") {
     contentHtml = `
             <div class="media-message">
-                <div class="media-content" onclick="openMedia('${messageData.media.file_path}')">
+                <div class="media-content" onclick="openMedia('${messageData.media.url}')">
                     <video controls>
-                        <source src="${messageData.media.file_path}" type="video/mp4">
+                        <source src="/chat/download/${messageData.media.id}?inline=1" type="video/mp4">
                         Your browser does not support the video tag.
                     </video>
                 </div>
@@ -289,7 +414,7 @@ function addMessage(messageData, type) {
     contentHtml = `
             <div class="audio-message">
                 <audio controls>
-                    <source src="${messageData.media.file_path}" type="audio/mpeg">
+                    <source src="/chat/download/${messageData.media.id}?inline=1" type="audio/mpeg">
                     Your browser does not support the audio element.
                 </audio>
                 <div class="message-time">${timestamp}</div>
@@ -298,7 +423,11 @@ function addMessage(messageData, type) {
   }
 
   messageElement.innerHTML = contentHtml;
-  container.appendChild(messageElement);
+  if (prepend) {
+    container.insertBefore(messageElement, container.firstChild);
+  } else {
+    container.appendChild(messageElement);
+  }
 }
 
 function formatMessage(content) {
@@ -352,6 +481,19 @@ function sendMessage() {
 function handleFileUpload(file) {
   if (!file) return;
 
+  if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+    uploadInChunks(file)
+      .then((data) => {
+        addMessage(data.message, "sent");
+        scrollToBottom();
+      })
+      .catch((error) => {
+        console.error("Error uploading file:", error);
+        showNotification(error.message || "Error uploading file", "error");
+      });
+    return;
+  }
+
   const formData = new FormData();
   formData.append("file", file);
   formData.append("type", getFileType(file.type));
@@ -376,6 +518,65 @@ function handleFileUpload(file) {
     });
 }
 
+// Resumable upload: init, PUT chunks at the server's offset, then commit.
+// A failed chunk is retried from whatever offset the server reports.
+async function uploadInChunks(file) {
+  const init = await uploadRequest("/chat/uploads", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  const uploadUrl = `/chat/uploads/${init.upload_id}`;
+  let offset = init.offset;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + init.chunk_size);
+    const headers = { "Content-Type": "application/octet-stream" };
+    const checksum = await sha256Hex(chunk);
+    if (checksum) headers["X-Chunk-SHA256"] = checksum;
+
+    try {
+      const result = await uploadRequest(`${uploadUrl}?offset=${offset}`, {
+        method: "PUT",
+        headers: headers,
+        body: chunk,
+      });
+      offset = result.offset;
+      failures = 0;
+    } catch (error) {
+      if (++failures > UPLOAD_MAX_RETRIES) {
+        fetch(uploadUrl, { method: "DELETE" });
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+      offset = (await uploadRequest(uploadUrl)).offset;
+    }
+  }
+
+  return uploadRequest(`${uploadUrl}/commit`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ type: getFileType(file.type) }),
+  });
+}
+
+async function uploadRequest(url, options) {
+  const response = await fetch(url, options);
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error || "Upload failed");
+  return data;
+}
+
+async function sha256Hex(blob) {
+  // crypto.subtle only exists in secure contexts; the server treats the header as optional
+  if (!window.crypto || !window.crypto.subtle) return null;
+  const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+}
+
 function getFileType(mimeType) {
   if (mimeType.startsWith("image/")) return "image";
   if (mimeType.startsWith("video/")) return "video";
@@ -542,18 +743,16 @@ function showMediaGallery() {
         data.media.forEach((media) => {
           const mediaItem = document.createElement("div");
           mediaItem.className = "media-item";
-          mediaItem.onclick = () => openMedia(media.file_path);
+          mediaItem.onclick = () => openMedia(media.url);
 
           if (media.file_type.startsWith("image/")) {
-            mediaItem.innerHTML = `<img src="${
-              media.thumbnail_path || media.file_path
-            }" alt="Media">`;
+            mediaItem.innerHTML = `<img src="/chat/media/${media.id}/rendition?w=320" alt="Media" loading="lazy" ${mediaLayoutAttrs(media, 320)}>`;
           } else if (media.file_type.startsWith("video/")) {
             mediaItem.innerHTML = `
                             <div class="video-thumbnail">
                                 <i class="fas fa-play"></i>
                                 <video>
-                                    <source src="${media.file_path}">
+                                    <source src="/chat/download/${media.id}?inline=1">
                                 </video>
                             </div>
                         `;
@@ -1272,6 +1471,18 @@ style.textContent = `
 `;
 document.head.appendChild(style);
 
+// Ack anything that arrived while the tab was hidden
+document.addEventListener("visibilitychange", function () {
+  const received = document.querySelectorAll(
+    "#messagesContainer .message.received"
+  );
+  if (received.length > 0) {
+    acknowledgeMessages(
+      Number(received[received.length - 1].dataset.messageId)
+    );
+  }
+});
+
 // Update the DOMContentLoaded event listener
 document.addEventListener("DOMContentLoaded", function () {
   if (PARTNER_ID) {
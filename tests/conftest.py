@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config reads the environment at import time, so this runs before app is imported
+TEST_DIR = tempfile.mkdtemp(prefix='lunalink-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ.setdefault('SECRET_KEY', 'lunalink-tests')
+os.environ['THUMBNAIL_ASYNC'] = 'false'
+if not os.environ.get('ENCRYPTION_KEY'):
+    from cryptography.fernet import Fernet
+    os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+import pytest
+
+from models import db, User, UserSettings
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app, prepare_app
+    app = create_app()
+    app.config['TESTING'] = True
+    prepare_app(app, background_jobs=False)
+    return app
+
+@pytest.fixture
+def client_for(app):
+    """Test client logged in as the given user id"""
+    def make(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return make
+
+def create_couple(name='A', partner_name='B'):
+    """Two linked users with default settings; returns their ids"""
+    user = User(name=name, email=f'{name.lower()}@tests.local', password_hash='x', is_verified=True)
+    partner = User(name=partner_name, email=f'{partner_name.lower()}@tests.local', password_hash='x',
+                   is_verified=True)
+    db.session.add_all([user, partner])
+    db.session.flush()
+    user.partner_id, partner.partner_id = partner.id, user.id
+    db.session.add_all([UserSettings(user_id=user.id), UserSettings(user_id=partner.id)])
+    db.session.commit()
+    return user.id, partner.id
+
+def session_cookie(app, user_id):
+    """Signed Flask session cookie that Flask-Login accepts as a logged-in user"""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'_user_id': str(user_id), '_fresh': True})
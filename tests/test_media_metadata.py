@@ -0,0 +1,33 @@
+"""Video layout metadata read straight from MP4 boxes."""
+import struct
+
+import pytest
+
+from utils.media_metadata import extract_metadata
+
+IDENTITY = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+ROTATE_90 = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+ROTATE_270 = (0, -0x10000, 0, 0x10000, 0, 0, 0, 0, 0x40000000)
+
+def box(kind, body):
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+def mp4(matrix, width=1920, height=1080, timescale=1000, duration=12500):
+    mvhd = struct.pack('>4xIIII', 0, 0, timescale, duration) + bytes(80)
+    tkhd = (struct.pack('>4xIII4xI8x', 0, 0, 1, duration) + bytes(8)
+            + struct.pack('>9i', *matrix) + struct.pack('>II', width << 16, height << 16))
+    return box(b'ftyp', b'isom\0\0\2\0') + box(b'moov', box(b'mvhd', mvhd) + box(b'trak', box(b'tkhd', tkhd)))
+
+@pytest.mark.parametrize('matrix, expected', [
+    (IDENTITY, (1920, 1080)),
+    (ROTATE_90, (1080, 1920)),
+    (ROTATE_270, (1080, 1920)),
+])
+def test_mp4_size_is_in_display_orientation(tmp_path, matrix, expected):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(mp4(matrix))
+
+    metadata = extract_metadata(str(path), 'video/mp4')
+
+    assert (metadata['width'], metadata['height']) == expected
+    assert metadata['duration'] == 12.5
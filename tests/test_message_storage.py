@@ -0,0 +1,26 @@
+"""Moving existing rows between message storage modes."""
+from tests.conftest import create_couple
+from models import db, Message, conversation_key_for
+from utils.message_storage import compact_message_storage
+
+def test_ciphertext_only_rows_are_restored_to_dual(app):
+    with app.app_context():
+        user_id, partner_id = create_couple('Ida', 'Jon')
+        key = conversation_key_for(user_id, partner_id)
+        db.session.add_all([
+            Message(sender_id=user_id, receiver_id=partner_id, conversation_key=key, content=f'hello {i}')
+            for i in range(3)
+        ])
+        db.session.commit()
+
+        compact_message_storage('dual', pause=0)
+        compact_message_storage('ciphertext', pause=0)
+        assert {message.content for message in Message.query.filter_by(conversation_key=key)} == {''}
+
+        # Every row in the shared test database was compacted, so every row comes back
+        assert compact_message_storage('dual', pause=0) == Message.query.count()
+        messages = Message.query.filter_by(conversation_key=key).order_by(Message.id).all()
+        assert [message.content for message in messages] == ['hello 0', 'hello 1', 'hello 2']
+        assert all(message.encrypted_content for message in messages)
+
+        assert compact_message_storage('dual', pause=0) == 0
@@ -0,0 +1,162 @@
+"""Two wsgi.py workers sharing the local pub/sub broker, partners on different workers."""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+import socketio as socketio_client
+
+from tests.conftest import ROOT, create_couple, session_cookie
+from utils.local_pubsub import LocalBroker
+
+DEBOUNCE_SECONDS = 1
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+def start_worker(index, port, queue_url):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE='threading', SERVER_ALLOW_DEV_SERVER='true',
+               SERVER_HOST='127.0.0.1', SERVER_PORT=str(port), SERVER_WORKERS='1',
+               SERVER_WORKER_INDEX=str(index), SOCKETIO_MESSAGE_QUEUE=queue_url,
+               PRESENCE_DEBOUNCE_SECONDS=str(DEBOUNCE_SECONDS))
+    worker = subprocess.Popen([sys.executable, os.path.join(ROOT, 'wsgi.py')], env=env, cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    if not wait_until(lambda: _accepts(url), timeout=20):
+        worker.terminate()
+        raise RuntimeError(f'worker {index} did not start')
+    return worker, url
+
+def _accepts(url):
+    try:
+        requests.get(f'{url}/auth/login', timeout=1)
+        return True
+    except requests.ConnectionError:
+        return False
+
+class Tab:
+    """A Socket.IO client logged in as one user, recording every event it receives"""
+
+    def __init__(self, app, url, user_id):
+        self.events = []
+        self.client = socketio_client.Client(reconnection=False)
+        self.client.on('*', lambda event, data: self.events.append((event, data)))
+        cookie = f"{app.config.get('SESSION_COOKIE_NAME', 'session')}={session_cookie(app, user_id)}"
+        self.client.connect(url, headers={'Cookie': cookie}, wait_timeout=5)
+
+    def received(self, event):
+        return [data for name, data in self.events if name == event]
+
+@pytest.fixture(scope='module')
+def cluster(app):
+    broker_port = free_port()
+    broker = LocalBroker('127.0.0.1', broker_port)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+
+    with app.app_context():
+        user_id, partner_id = create_couple('Ada', 'Ben')
+
+    queue_url = f'local://127.0.0.1:{broker_port}'
+    workers = [start_worker(index, free_port(), queue_url) for index in range(2)]
+    try:
+        yield app, [url for _, url in workers], user_id, partner_id
+    finally:
+        for worker, _ in workers:
+            worker.terminate()
+            worker.wait(10)
+        broker.shutdown()
+        broker.server_close()
+
+def test_message_between_partners_on_different_workers(cluster):
+    app, (first, second), user_id, partner_id = cluster
+    sender = Tab(app, first, user_id)
+    receiver = Tab(app, second, partner_id)
+    try:
+        sender.client.emit('send_message', {'message': 'across workers'})
+
+        assert wait_until(lambda: receiver.received('new_message'))
+        assert receiver.received('new_message')[0]['content'] == 'across workers'
+        assert wait_until(lambda: sender.received('message_sent'))
+    finally:
+        sender.client.disconnect()
+        receiver.client.disconnect()
+
+def test_presence_spans_workers(cluster):
+    app, (first, second), user_id, partner_id = cluster
+    partner = Tab(app, second, partner_id)
+    tab_one = Tab(app, first, user_id)
+    tab_two = Tab(app, second, user_id)
+    try:
+        # Closing the tab on the first worker leaves the user online through the second
+        tab_one.client.disconnect()
+        time.sleep(DEBOUNCE_SECONDS + 1)
+        assert partner.received('user_offline') == []
+
+        # The first worker now holds none of the user's sockets but still reports them online
+        page = requests.get(f'{first}/chat/', cookies={'session': session_cookie(app, partner_id)})
+        assert page.status_code == 200
+        assert 'status-dot online' in page.text
+
+        tab_two.client.disconnect()
+        assert wait_until(lambda: partner.received('user_offline'), timeout=DEBOUNCE_SECONDS + 3)
+        assert len(partner.received('user_offline')) == 1
+
+        page = requests.get(f'{first}/chat/', cookies={'session': session_cookie(app, partner_id)})
+        assert 'status-dot offline' in page.text
+    finally:
+        for tab in (tab_one, tab_two, partner):
+            if tab.client.connected:
+                tab.client.disconnect()
+
+def test_typing_burst_ends_from_a_tab_on_another_worker(cluster):
+    app, (first, second), user_id, partner_id = cluster
+    partner = Tab(app, first, partner_id)
+    typing_tab = Tab(app, first, user_id)
+    sending_tab = Tab(app, second, user_id)
+    try:
+        typing_tab.client.emit('typing', {})
+        assert wait_until(lambda: partner.received('user_typing'))
+        time.sleep(0.2)
+
+        # Well inside TYPING_TIMEOUT_SECONDS, so only the forwarded stop can end the burst
+        sending_tab.client.emit('send_message', {'message': 'sent from the other tab'})
+        assert wait_until(lambda: partner.received('user_stop_typing'), timeout=2)
+        assert len(partner.received('user_typing')) == 1
+    finally:
+        for tab in (typing_tab, sending_tab, partner):
+            tab.client.disconnect()
+
+def test_partner_removed_on_another_worker_reaches_open_sockets(cluster):
+    app, (first, second), _, _ = cluster
+    with app.app_context():
+        user_id, partner_id = create_couple('Cleo', 'Dan')
+    sender = Tab(app, first, user_id)
+    ex_partner = Tab(app, second, partner_id)
+    try:
+        removed = requests.delete(f'{second}/dashboard/remove-partner',
+                                  cookies={'session': session_cookie(app, user_id)})
+        assert removed.json()['success']
+
+        # The first worker hears about the commit over the queue and rebuilds the socket's context
+        time.sleep(0.5)
+        sender.client.emit('send_message', {'message': 'still linked?'})
+        assert wait_until(lambda: sender.received('error'))
+        assert sender.received('error')[0]['message'] == 'No partner linked'
+        assert ex_partner.received('new_message') == []
+    finally:
+        sender.client.disconnect()
+        ex_partner.client.disconnect()
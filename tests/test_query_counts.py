@@ -0,0 +1,60 @@
+"""Each page endpoint costs a fixed number of queries, however many messages it serializes."""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from tests.conftest import create_couple
+from models import db, Media, Message, conversation_key_for
+
+@contextmanager
+def counted_queries(app):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+def add_messages(user_id, partner_id, count):
+    """count messages alternating senders, every third one carrying an image"""
+    key = conversation_key_for(user_id, partner_id)
+    for i in range(count):
+        sender, receiver = (user_id, partner_id) if i % 2 else (partner_id, user_id)
+        message = Message(sender_id=sender, receiver_id=receiver, conversation_key=key,
+                          content=f'message {i}', message_type='image' if i % 3 == 0 else 'text')
+        db.session.add(message)
+        if i % 3 == 0:
+            db.session.add(Media(message=message, file_path=f'instance/media/images/{i}.jpg',
+                                 file_type='image/jpeg', file_size=1))
+    db.session.commit()
+
+ENDPOINTS = [
+    '/chat/messages?partner_id={partner_id}&limit=100',
+    '/chat/media?limit=100',
+    '/dashboard/memories',
+]
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_query_count_does_not_grow_with_page_size(app, client_for, endpoint):
+    counts = []
+    for size in (3, 60):
+        with app.app_context():
+            user_id, partner_id = create_couple(f'U{size}{len(endpoint)}', f'P{size}{len(endpoint)}')
+            add_messages(user_id, partner_id, size)
+        client = client_for(user_id)
+        url = endpoint.format(partner_id=partner_id)
+        # The first request loads the user into the identity cache
+        assert client.get(url).status_code == 200
+
+        with counted_queries(app) as statements:
+            assert client.get(url).status_code == 200
+        counts.append(len(statements))
+
+    # The page plus its selectin-loaded media; /chat/media joins instead and adds the month buckets
+    assert counts == [2, 2]
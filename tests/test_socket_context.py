@@ -0,0 +1,20 @@
+"""Socket contexts follow the account they were captured from."""
+from tests.conftest import create_couple
+from models import db, User, UserSettings
+from utils.socket_context import socket_contexts
+
+def test_deleted_account_drops_its_socket(app):
+    with app.app_context():
+        user_id, partner_id = create_couple('Ivy', 'Jay')
+        user = db.session.get(User, user_id)
+        socket_contexts.open('sid-ivy', user)
+
+        db.session.get(User, partner_id).partner_id = None
+        user.partner_id = None
+        UserSettings.query.filter_by(user_id=user_id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+        assert socket_contexts.get('sid-ivy') is None
+        # Dropped rather than kept around to be re-checked on every event
+        assert socket_contexts.close('sid-ivy') is None
@@ -0,0 +1,22 @@
+"""Streak day cache only trusts committed writes."""
+from datetime import date
+
+from tests.conftest import create_couple
+from models import db
+from utils.streaks import streak_service
+
+TODAY = date(2026, 3, 1)
+
+def test_rolled_back_batch_leaves_the_day_unrecorded(app):
+    with app.app_context():
+        user_id, partner_id = create_couple('Sam', 'Kim')
+
+        assert streak_service.record_message(user_id, partner_id, commit=False, today=TODAY)
+        db.session.rollback()
+
+        # The batch never landed, so the next message writes the streak again
+        assert streak_service.record_message(user_id, partner_id, commit=False, today=TODAY)
+        db.session.commit()
+
+        assert not streak_service.record_message(user_id, partner_id, today=TODAY)
+        assert streak_service.get_streak(user_id, partner_id).last_chat_date == TODAY
@@ -7,6 +7,10 @@ from .encryption import (
     generate_encryption_key,
     encrypt_message,
     decrypt_message,
+    encrypt_many,
+    decrypt_many,
+    reencrypt_many,
+    get_cipher_registry,
     generate_otp,
     hash_file
 )
@@ -20,7 +24,6 @@ from .email_sender import (
 from .file_handler import (
     allowed_file,
     get_file_type,
-    save_media_file,
     generate_image_thumbnail,
     generate_video_thumbnail,
     validate_image,
@@ -68,6 +71,10 @@ __all__ = [
     'generate_encryption_key',
     'encrypt_message',
     'decrypt_message',
+    'encrypt_many',
+    'decrypt_many',
+    'reencrypt_many',
+    'get_cipher_registry',
     'generate_otp',
     'hash_file',
     
@@ -79,7 +86,6 @@ __all__ = [
     # File handling
     'allowed_file',
     'get_file_type',
-    'save_media_file',
     'generate_image_thumbnail',
     'generate_video_thumbnail',
     'validate_image',
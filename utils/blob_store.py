@@ -0,0 +1,175 @@
+"""Content-addressed media storage.
+
+Every upload is hashed while it streams to a staging file. The bytes are then
+kept once per SHA-256, as a MediaBlob, and each Media row points at its blob
+through blob_digest. A couple forwarding the same photo back and forth costs
+one file and one thumbnail.
+
+MediaBlob.ref_count follows Media inserts and deletes (see models.py).
+collect_garbage() recounts from the media table before it deletes anything, so
+drift from bulk deletes can never remove a file that is still referenced.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Media, MediaBlob
+from utils.file_handler import get_file_type_for_name
+from utils.media_storage import media_storage
+from utils.media_metadata import METADATA_FIELDS, copy_metadata
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+def _staging_folder():
+    folder = current_app.config.get('UPLOAD_STAGING_FOLDER', 'instance/upload_staging')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def stage_upload(file):
+    """Stream an uploaded FileStorage to a staging file; returns (path, sha256 hex, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    handle, staged_path = tempfile.mkstemp(dir=_staging_folder(), suffix='.upload')
+    with os.fdopen(handle, 'wb') as staged:
+        for block in iter(lambda: file.stream.read(STREAM_BLOCK_SIZE), b''):
+            staged.write(block)
+            digest.update(block)
+            size += len(block)
+    return staged_path, digest.hexdigest(), size
+
+def blob_path(digest, filename):
+    """Where the bytes for digest live, under MEDIA_ROOT/<kind>/ in the configured layout"""
+    file_ext = filename.rsplit('.', 1)[1].lower()
+    file_type = get_file_type_for_name(filename)
+    kind = file_type.split('/')[0]
+    folder = {'image': 'images', 'video': 'videos', 'audio': 'audio'}.get(kind, 'files')
+    return media_storage.path_for(folder, f"{digest}.{file_ext}")
+
+def put_blob(staged_path, digest, size, filename):
+    """Adopt a staged file as the blob for digest; returns (blob, created).
+
+    An existing blob wins and the staged copy is dropped. The blob row is
+    added in a savepoint, so two uploads racing with the same new bytes end
+    up sharing one row.
+    """
+    blob = db.session.get(MediaBlob, digest)
+    if blob is not None and os.path.exists(blob.file_path):
+        os.remove(staged_path)
+        return blob, False
+
+    save_path = blob.file_path if blob is not None else blob_path(digest, filename)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    os.replace(staged_path, save_path)
+    if blob is not None:
+        # Row survived but the file went missing; the bytes are back now
+        return blob, True
+
+    blob = MediaBlob(
+        digest=digest,
+        file_path=save_path,
+        file_type=get_file_type_for_name(filename),
+        size=size,
+        ref_count=0
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        return db.session.get(MediaBlob, digest), False
+    return blob, True
+
+def store_upload(file, filename):
+    """Stream, hash and store a FileStorage; returns (blob, created)"""
+    staged_path, digest, size = stage_upload(file)
+    return put_blob(staged_path, digest, size, filename)
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(STREAM_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def record_thumbnail(digest, thumbnail_path):
+    """Share a freshly rendered thumbnail with the blob and every Media row on it"""
+    blob = db.session.get(MediaBlob, digest)
+    if blob is not None:
+        blob.thumbnail_path = thumbnail_path
+    Media.query.filter_by(blob_digest=digest, thumbnail_path=None).update(
+        {'thumbnail_path': thumbnail_path}, synchronize_session=False
+    )
+
+def record_metadata(digest, metadata):
+    """Share extracted layout metadata with the blob and every Media row on it"""
+    blob = db.session.get(MediaBlob, digest)
+    if blob is not None:
+        copy_metadata(metadata, blob)
+    Media.query.filter_by(blob_digest=digest).update(
+        {field: metadata.get(field) for field in METADATA_FIELDS}, synchronize_session=False
+    )
+
+def collect_garbage(grace_seconds=3600):
+    """Delete blobs no Media row references; returns (blobs removed, bytes freed).
+
+    Blobs younger than grace_seconds are left alone so an upload that has
+    stored its blob but not yet committed its Media row is not collected.
+    """
+    counts = dict(db.session.query(Media.blob_digest, db.func.count(Media.id)).filter(
+        Media.blob_digest.isnot(None)
+    ).group_by(Media.blob_digest).all())
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed = freed = 0
+    for blob in MediaBlob.query.all():
+        blob.ref_count = counts.get(blob.digest, 0)
+        if blob.ref_count or blob.created_at > cutoff:
+            continue
+        # Rows written by the old save path point at files directly
+        if Media.query.filter_by(file_path=blob.file_path).first() is not None:
+            continue
+
+        for path in (blob.file_path, blob.thumbnail_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        db.session.delete(blob)
+        removed += 1
+        freed += blob.size
+
+    db.session.commit()
+    if removed:
+        logging.info(f"Media GC removed {removed} blobs ({freed} bytes)")
+    return removed, freed
+
+def start_blob_gc(app, socketio):
+    """Run collect_garbage every BLOB_GC_INTERVAL_SECONDS"""
+    def run():
+        while True:
+            socketio.sleep(app.config.get('BLOB_GC_INTERVAL_SECONDS', 6 * 60 * 60))
+            with app.app_context():
+                try:
+                    collect_garbage(app.config.get('BLOB_GC_GRACE_SECONDS', 3600))
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Media GC error: {str(e)}")
+
+    return socketio.start_background_task(run)
+
+def dedup_stats():
+    """Bytes referenced by Media rows vs bytes on disk for blob-backed media"""
+    logical = db.session.query(db.func.coalesce(db.func.sum(MediaBlob.size), 0)).select_from(Media).join(
+        MediaBlob, Media.blob_digest == MediaBlob.digest
+    ).scalar()
+    physical, blobs = db.session.query(
+        db.func.coalesce(db.func.sum(MediaBlob.size), 0), db.func.count(MediaBlob.digest)
+    ).filter(MediaBlob.ref_count > 0).one()
+    return {
+        'logical_bytes': logical,
+        'physical_bytes': physical,
+        'blobs': blobs,
+        'dedup_ratio': round(logical / physical, 2) if physical else 1.0
+    }
@@ -0,0 +1,157 @@
+"""Resumable chunked uploads.
+
+Protocol (routes in routes/chat_routes.py):
+
+    POST   /chat/uploads                 {filename, size, sha256?}  -> {upload_id, offset, chunk_size}
+    GET    /chat/uploads/<id>                                       -> {offset, size}
+    PUT    /chat/uploads/<id>?offset=N   raw chunk bytes, X-Chunk-SHA256 header
+    POST   /chat/uploads/<id>/commit     {type, message?}           -> Message with Media
+    DELETE /chat/uploads/<id>
+
+State lives next to the staged bytes on disk: <id>.json holds what init was
+told and <id>.part is the data so far, so its size is the resume offset and
+any worker can take the next chunk.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from flask import current_app
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+class UploadError(Exception):
+    """Rejected upload step; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+def _staging_folder():
+    folder = current_app.config.get('UPLOAD_STAGING_FOLDER', 'instance/upload_staging')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def _paths(upload_id):
+    # upload ids are uuid4 hex; anything else never touches the filesystem
+    if len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+        raise UploadError('Unknown upload', 404)
+    base = os.path.join(_staging_folder(), upload_id)
+    return base + '.json', base + '.part'
+
+def _offset(part_path):
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+def start_upload(user_id, filename, size, sha256=None):
+    """Create a staging entry; returns the upload state"""
+    max_size = current_app.config.get('UPLOAD_MAX_FILE_SIZE', 200 * 1024 * 1024)
+    if size <= 0 or size > max_size:
+        raise UploadError(f'File size must be between 1 byte and {max_size} bytes', 413)
+
+    purge_stale_uploads(current_app.config.get('UPLOAD_STAGING_MAX_AGE_SECONDS', 24 * 60 * 60))
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(upload_id)
+    state = {
+        'upload_id': upload_id,
+        'user_id': user_id,
+        'filename': filename,
+        'size': size,
+        'sha256': sha256.lower() if sha256 else None,
+        'created_at': time.time()
+    }
+    with open(meta_path, 'w') as meta:
+        json.dump(state, meta)
+    open(part_path, 'wb').close()
+
+    state['offset'] = 0
+    return state
+
+def load_upload(upload_id, user_id):
+    """Upload state for its owner, including the current offset"""
+    meta_path, part_path = _paths(upload_id)
+    try:
+        with open(meta_path) as meta:
+            state = json.load(meta)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload', 404)
+
+    if state['user_id'] != user_id:
+        raise UploadError('Unknown upload', 404)
+
+    state['offset'] = _offset(part_path)
+    return state
+
+def append_chunk(state, offset, stream, length, checksum=None):
+    """Stream one chunk onto the staging file; returns the new offset.
+
+    The chunk must start exactly where the staged data ends, otherwise the
+    client is told the real offset (409) and resends from there. A chunk whose
+    SHA-256 does not match X-Chunk-SHA256 is cut off again (422).
+    """
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 1024 * 1024)
+    if offset != state['offset']:
+        raise UploadError('Offset mismatch', 409, offset=state['offset'])
+    if length is None or length <= 0 or length > chunk_size:
+        raise UploadError(f'Chunks must be between 1 and {chunk_size} bytes', 413)
+    if offset + length > state['size']:
+        raise UploadError('Chunk runs past the declared file size', 416, offset=offset)
+
+    _, part_path = _paths(state['upload_id'])
+    digest = hashlib.sha256()
+    written = 0
+
+    with open(part_path, 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if written != length or (checksum and digest.hexdigest() != checksum.lower()):
+            part.truncate(offset)
+            if written != length:
+                raise UploadError('Chunk ended early', 400, offset=offset)
+            raise UploadError('Chunk checksum mismatch', 422, offset=offset)
+        part.truncate(offset + written)
+
+    return offset + written
+
+def finish_upload(state):
+    """Verify the staged file is complete; returns (path, sha256 hex) for the caller to store"""
+    meta_path, part_path = _paths(state['upload_id'])
+    if state['offset'] != state['size']:
+        raise UploadError('Upload is incomplete', 409, offset=state['offset'])
+
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as part:
+        for block in iter(lambda: part.read(STREAM_BLOCK_SIZE), b''):
+            digest.update(block)
+    if state.get('sha256') and digest.hexdigest() != state['sha256']:
+        discard_upload(state['upload_id'])
+        raise UploadError('File checksum mismatch', 422)
+
+    os.remove(meta_path)
+    return part_path, digest.hexdigest()
+
+def discard_upload(upload_id):
+    for path in _paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+def purge_stale_uploads(max_age=24 * 60 * 60):
+    """Remove staging entries older than max_age seconds; returns how many"""
+    folder = _staging_folder()
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
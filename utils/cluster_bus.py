@@ -0,0 +1,98 @@
+"""Server-to-server messages between workers that share SOCKETIO_MESSAGE_QUEUE.
+
+The Socket.IO queue only carries emits to clients. State each worker keeps in
+memory (presence, typing bursts, identity snapshots) is kept in step by
+publishing small JSON messages on a sibling channel, <SOCKETIO_CHANNEL>-cluster,
+through the same backend: Redis, any Kombu URL, or the local:// broker.
+
+    cluster_bus.subscribe('presence.sockets', handler)   # handler(message)
+    cluster_bus.publish('presence.sockets', user_id=1, online=True)
+
+A worker never hears its own messages. Without a message queue there is a
+single process with nothing to sync, so publish() is a no-op.
+
+The I/O goes through the client managers' _publish/_listen, which are not
+python-socketio's public API; requirements.txt pins the version this was
+written against (utils/local_pubsub.py leans on the same internals).
+"""
+import json
+import logging
+import threading
+import uuid
+
+import socketio as socketio_lib
+
+from utils.local_pubsub import LocalPubSubManager
+
+RECONNECT_DELAY_SECONDS = 1
+
+def _transport_for(config):
+    """Write-only Socket.IO client manager on the cluster channel; its _publish/_listen do the I/O"""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return None
+
+    channel = f"{config.get('SOCKETIO_CHANNEL', 'flask-socketio')}-cluster"
+    if url.startswith('local://'):
+        return LocalPubSubManager(url, channel=channel, write_only=True)
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio_lib.RedisManager(url, channel=channel, write_only=True)
+    return socketio_lib.KombuManager(url, channel=channel, write_only=True)
+
+class ClusterBus:
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.socketio = None
+        self._transport = None
+        self._handlers = {}
+        self._started = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self._transport = _transport_for(app.config)
+
+    @property
+    def enabled(self):
+        return self._transport is not None
+
+    def subscribe(self, kind, handler):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def publish(self, kind, **payload):
+        """Send a message of this kind to every other worker"""
+        if not self.enabled:
+            return
+        self.start()
+        try:
+            self._transport._publish({'kind': kind, 'worker': self.worker_id, **payload})
+        except Exception as e:
+            logging.error(f"Cluster publish error ({kind}): {str(e)}")
+
+    def start(self):
+        """Start listening; called by the server entrypoints and on first use"""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                for raw in self._transport._listen():
+                    self.dispatch(raw if isinstance(raw, dict) else json.loads(raw))
+            except Exception as e:
+                logging.error(f"Cluster listener error: {str(e)}")
+            self.socketio.sleep(RECONNECT_DELAY_SECONDS)
+
+    def dispatch(self, message):
+        if message.get('worker') == self.worker_id:
+            return
+        for handler in self._handlers.get(message.get('kind'), ()):
+            try:
+                handler(message)
+            except Exception as e:
+                logging.error(f"Cluster handler error ({message.get('kind')}): {str(e)}")
+
+cluster_bus = ClusterBus()
@@ -1,6 +1,9 @@
 import base64
+import hashlib
 import os
-from cryptography.fernet import Fernet
+import threading
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import random
@@ -20,23 +23,123 @@ def generate_encryption_key(password: str, salt: bytes = None) -> tuple:
     key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
     return key, salt
 
+# Compact storage format: "v2:<key id>:<fernet token>". Legacy values are the
+# Fernet token base64-encoded a second time, with no prefix.
+COMPACT_PREFIX = 'v2:'
+
+def key_id_for(key: bytes) -> str:
+    """Short stable identifier for a Fernet key"""
+    return hashlib.sha256(key).hexdigest()[:8]
+
+class CipherRegistry:
+    """Fernet objects built once per process, keyed by key id.
+
+    The first key encrypts; every key can decrypt, so old keys stay listed in
+    ENCRYPTION_KEYS (comma separated, newest first) until rotation finishes.
+    """
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('No encryption keys configured')
+        self.ciphers = {}
+        for key in keys:
+            self.ciphers[key_id_for(key)] = Fernet(key)
+        self.primary_id = key_id_for(keys[0])
+        self.primary = self.ciphers[self.primary_id]
+        self.multi = MultiFernet(list(self.ciphers.values()))
+
+    @classmethod
+    def from_environment(cls):
+        raw_keys = os.environ.get('ENCRYPTION_KEYS') or os.environ.get('ENCRYPTION_KEY') or ''
+        return cls([key.strip().encode() for key in raw_keys.split(',') if key.strip()])
+
+    def cipher_for(self, key_id: str):
+        """Cipher for a stored key id, falling back to trying every key"""
+        return self.ciphers.get(key_id, self.multi)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_cipher_registry() -> CipherRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CipherRegistry.from_environment()
+    return _registry
+
+def reset_cipher_registry():
+    """Drop cached ciphers so the next call re-reads the keys from the environment"""
+    global _registry
+    with _registry_lock:
+        _registry = None
+
+@lru_cache(maxsize=16)
+def _fernet_for_key(key: bytes) -> Fernet:
+    return Fernet(key)
+
+def _split_stored(encrypted_message: str):
+    """Return (key_id, token) for compact values, (None, token) for legacy ones"""
+    if encrypted_message.startswith(COMPACT_PREFIX):
+        key_id, token = encrypted_message[len(COMPACT_PREFIX):].split(':', 1)
+        return key_id, token.encode()
+    return None, base64.urlsafe_b64decode(encrypted_message)
+
 def encrypt_message(message: str, key: bytes = None) -> str:
-    """Encrypt a message"""
+    """Encrypt a message into the compact storage format"""
     if key is None:
-        key = os.environ.get('ENCRYPTION_KEY').encode()
+        registry = get_cipher_registry()
+        key_id, fernet = registry.primary_id, registry.primary
+    else:
+        key_id, fernet = key_id_for(key), _fernet_for_key(key)
     
-    fernet = Fernet(key)
-    encrypted = fernet.encrypt(message.encode())
-    return base64.urlsafe_b64encode(encrypted).decode()
+    token = fernet.encrypt(message.encode())
+    return f"{COMPACT_PREFIX}{key_id}:{token.decode()}"
 
 def decrypt_message(encrypted_message: str, key: bytes = None) -> str:
-    """Decrypt a message"""
+    """Decrypt a message stored in either the compact or the legacy format"""
+    key_id, token = _split_stored(encrypted_message)
+    
+    if key is not None:
+        fernet = _fernet_for_key(key)
+    elif key_id is None:
+        fernet = get_cipher_registry().multi
+    else:
+        fernet = get_cipher_registry().cipher_for(key_id)
+    
+    return fernet.decrypt(token).decode()
+
+def encrypt_many(messages, key: bytes = None) -> list:
+    """Encrypt a batch of messages with a single cipher lookup"""
     if key is None:
-        key = os.environ.get('ENCRYPTION_KEY').encode()
+        registry = get_cipher_registry()
+        key_id, fernet = registry.primary_id, registry.primary
+    else:
+        key_id, fernet = key_id_for(key), _fernet_for_key(key)
+    
+    prefix = f"{COMPACT_PREFIX}{key_id}:"
+    return [prefix + fernet.encrypt(message.encode()).decode() for message in messages]
+
+def decrypt_many(encrypted_messages, key: bytes = None) -> list:
+    """Decrypt a batch of stored messages, e.g. for history export"""
+    return [decrypt_message(encrypted_message, key) for encrypted_message in encrypted_messages]
+
+def reencrypt_many(encrypted_messages) -> list:
+    """Re-encrypt stored messages under the primary key in the compact format.
+
+    Used by key rotation jobs; legacy values are upgraded along the way.
+    """
+    registry = get_cipher_registry()
+    prefix = f"{COMPACT_PREFIX}{registry.primary_id}:"
     
-    fernet = Fernet(key)
-    decrypted = fernet.decrypt(base64.urlsafe_b64decode(encrypted_message))
-    return decrypted.decode()
+    rotated = []
+    for encrypted_message in encrypted_messages:
+        key_id, token = _split_stored(encrypted_message)
+        if key_id == registry.primary_id:
+            rotated.append(encrypted_message)
+        else:
+            rotated.append(prefix + registry.multi.rotate(token).decode())
+    return rotated
 
 def generate_otp(length=6) -> str:
     """Generate OTP code"""
@@ -1,7 +1,9 @@
 import os
-import uuid
-from werkzeug.utils import secure_filename
-from PIL import Image, ImageOps
+from PIL import Image
+
+from utils.imaging import shrink_image
+from utils.media_storage import media_storage
+from utils.media_metadata import extract_metadata, copy_metadata
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {
@@ -14,7 +16,11 @@ def allowed_file(filename):
 
 def get_file_type(file):
     """Determine file type using file extension"""
-    filename = file.filename.lower()
+    return get_file_type_for_name(file.filename)
+
+def get_file_type_for_name(filename):
+    """MIME type for a filename, by extension"""
+    filename = filename.lower()
     
     # Image types
     image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
@@ -37,62 +43,25 @@ def get_file_type(file):
     
     return 'application/octet-stream'
 
-def save_media_file(file, filename):
-    """Save media file and generate thumbnail if needed"""
-    # Create unique filename
-    file_ext = filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{uuid.uuid4()}.{file_ext}"
-    
-    # Determine file type and save path
-    file_type = get_file_type(file)
-    
-    if file_type.startswith('image'):
-        save_path = os.path.join('static/uploads/images', unique_filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
-        
-        # Generate thumbnail for images
-        thumbnail_path = generate_image_thumbnail(save_path, unique_filename)
-        return save_path, thumbnail_path
-        
-    elif file_type.startswith('video'):
-        save_path = os.path.join('static/uploads/videos', unique_filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
-        return save_path, None
-        
-    elif file_type.startswith('audio'):
-        save_path = os.path.join('static/uploads/audio', unique_filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
-        return save_path, None
-        
-    else:
-        save_path = os.path.join('static/uploads/files', unique_filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
-        return save_path, None
+def blob_files(blob, created, thumbnail=True):
+    """(file_path, thumbnail_path) for a blob from utils.blob_store, rendering thumbnail and metadata only for new bytes"""
+    if thumbnail and created:
+        if blob.file_type.startswith('image'):
+            blob.thumbnail_path = generate_image_thumbnail(blob.file_path, os.path.basename(blob.file_path))
+        copy_metadata(extract_metadata(blob.file_path, blob.file_type, preview_path=blob.thumbnail_path), blob)
+    return blob.file_path, blob.thumbnail_path
 
 def generate_image_thumbnail(image_path, filename):
     """Generate thumbnail for image"""
     try:
-        image = Image.open(image_path)
-        image.thumbnail((200, 200), Image.Resampling.LANCZOS)
-        
-        thumbnail_path = os.path.join('static/uploads/thumbnails', filename)
+        thumbnail_path = media_storage.path_for('thumbnails', filename)
         os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
         
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[-1])
-            image = background
-        
         # Convert to JPEG for thumbnails
         if thumbnail_path.lower().endswith(('.png', '.gif')):
             thumbnail_path = thumbnail_path.rsplit('.', 1)[0] + '.jpg'
         
-        image.save(thumbnail_path, 'JPEG', quality=85)
+        shrink_image(image_path, thumbnail_path, (200, 200), quality=85)
         return thumbnail_path
     except Exception as e:
         print(f"Error generating thumbnail: {e}")
@@ -4,7 +4,7 @@ import string
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, current_app
-from PIL import Image
+from utils.imaging import shrink_image
 import io
 import base64
 from urllib.parse import urlparse, urljoin
@@ -27,18 +27,8 @@ def allowed_file(filename, allowed_extensions=None):
 def resize_image(image_path, max_size=(800, 800), quality=85):
     """Resize an image while maintaining aspect ratio"""
     try:
-        with Image.open(image_path) as img:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            
-            # Save the resized image
-            img.save(image_path, 'JPEG', quality=quality, optimize=True)
-            return True
+        shrink_image(image_path, image_path, max_size, quality=quality, optimize=True)
+        return True
     except Exception as e:
         current_app.logger.error(f"Error resizing image {image_path}: {str(e)}")
         return False
@@ -46,17 +36,8 @@ def resize_image(image_path, max_size=(800, 800), quality=85):
 def generate_thumbnail(image_path, thumbnail_path, size=(200, 200)):
     """Generate a thumbnail for an image"""
     try:
-        with Image.open(image_path) as img:
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            
-            img.save(thumbnail_path, 'JPEG', quality=80, optimize=True)
-            return True
+        shrink_image(image_path, thumbnail_path, size, quality=80, optimize=True)
+        return True
     except Exception as e:
         current_app.logger.error(f"Error generating thumbnail {thumbnail_path}: {str(e)}")
         return False
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+
+from models import db, User, UserSettings
+from utils.cluster_bus import cluster_bus
+
+def _detached_copy(user):
+    """Column-only copy of a User that belongs to no session"""
+    return User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+
+class IdentityCache:
+    """Process-local TTL/LRU cache of the logged-in user and their partner.
+
+    load_user hands out db.session.merge(snapshot, load=False), which attaches
+    a fresh copy to the request's session without any SQL. The partner is part
+    of the snapshot, so current_user.partner is answered from the identity map.
+
+    Any committed flush that touches a User (profile edits, partner changes,
+    password resets, account deletion) drops that user and whoever has them
+    as partner. The change is published to the other workers (see
+    utils/cluster_bus.py), which drop the same entries; a lost message is
+    caught up within IDENTITY_CACHE_TTL_SECONDS. Callbacks registered with
+    on_write also hear about UserSettings writes, from any worker.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_size = 1024
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._write_callbacks = []
+        self._listening = False
+
+    def init_app(self, app):
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL_SECONDS', self.ttl)
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_user_writes)
+            event.listen(Session, 'after_commit', _invalidate_committed_writes)
+            event.listen(Session, 'after_soft_rollback', _discard_user_writes)
+            cluster_bus.subscribe('identity.changed', self._remote_commit)
+            self._listening = True
+
+    def load(self, user_id):
+        """The user attached to the current session, from cache when possible"""
+        snapshot = self._get(user_id)
+        if snapshot is None:
+            user = db.session.get(User, user_id, options=[joinedload(User.partner)])
+            if user is not None:
+                self._put(user)
+            return user
+        return db.session.merge(snapshot, load=False)
+
+    def _get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, user):
+        snapshot = _detached_copy(user)
+        partner = user.partner
+        snapshot.partner = _detached_copy(partner) if partner else None
+        if snapshot.partner is not None:
+            make_transient_to_detached(snapshot.partner)
+        make_transient_to_detached(snapshot)
+
+        with self._lock:
+            self._entries[user.id] = (snapshot, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def on_write(self, callback):
+        """Call callback(user_ids) after a commit that changed those users or their settings"""
+        self._write_callbacks.append(callback)
+
+    def committed(self, user_ids, settings_user_ids, publish=True):
+        if user_ids:
+            self.invalidate(*user_ids)
+        for callback in self._write_callbacks:
+            callback(user_ids | settings_user_ids)
+        if publish:
+            cluster_bus.publish('identity.changed', user_ids=list(user_ids),
+                                settings_user_ids=list(settings_user_ids))
+
+    def _remote_commit(self, message):
+        self.committed(set(message['user_ids']), set(message['settings_user_ids']), publish=False)
+
+    def invalidate(self, *user_ids):
+        """Drop the given users and every snapshot that carries them as partner"""
+        user_ids = set(user_ids)
+        with self._lock:
+            stale = [key for key, (snapshot, _) in self._entries.items()
+                     if key in user_ids or snapshot.partner_id in user_ids]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+def _collect_user_writes(session, flush_context):
+    changed = list(session.dirty) + list(session.deleted)
+    users = {obj.id for obj in changed if isinstance(obj, User)}
+    settings = {obj.user_id for obj in changed + list(session.new) if isinstance(obj, UserSettings)}
+    if users or settings:
+        touched = session.info.setdefault('identity_cache_touched', (set(), set()))
+        touched[0].update(users)
+        touched[1].update(settings)
+
+def _invalidate_committed_writes(session):
+    touched = session.info.pop('identity_cache_touched', None)
+    if touched:
+        identity_cache.committed(*touched)
+
+def _discard_user_writes(session, previous_transaction):
+    session.info.pop('identity_cache_touched', None)
+
+identity_cache = IdentityCache()
@@ -0,0 +1,59 @@
+"""Shared image shrinking pipeline for thumbnails, resizes and renditions.
+
+Decoding a 12MP phone photo in full costs ~36MB of RGB and hundreds of
+milliseconds before any resizing starts. Instead:
+
+1. JPEGs are opened in draft mode, which makes libjpeg decode straight at
+   1/2, 1/4 or 1/8 scale (never below twice the target size).
+2. Other formats are reduced by an integer factor with Image.reduce() (via
+   reducing_gap) before the final LANCZOS resample.
+3. EXIF orientation is applied once, to the already small image.
+"""
+from PIL import Image, ImageOps
+
+# Keep at least this much headroom above the target before the final resample
+REDUCING_GAP = 2.0
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+_ORIENTATION_TAG = 0x0112
+
+def open_bounded(path, size):
+    """Open path shrunk to fit inside size (width, height), upright, never upscaled"""
+    with Image.open(path) as source:
+        width, height = source.size
+
+        # size is in display orientation; the stored pixels may be rotated
+        box = size
+        if source.getexif().get(_ORIENTATION_TAG, 1) in _ROTATED_ORIENTATIONS:
+            box = (size[1], size[0])
+
+        scale = min(box[0] / width, box[1] / height)
+        if scale < 1:
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+            if source.format == 'JPEG':
+                source.draft(source.mode, (int(target[0] * REDUCING_GAP), int(target[1] * REDUCING_GAP)))
+            image = source.resize(target, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        else:
+            image = source.copy()
+
+        # The resized copy keeps no EXIF of its own; orient it from the source's tags
+        image.info['exif'] = source.info.get('exif', b'')
+        return ImageOps.exif_transpose(image)
+
+def flatten(image, background=(255, 255, 255)):
+    """RGB copy suitable for JPEG; transparency is composited onto background"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        flat = Image.new('RGB', image.size, background)
+        flat.paste(image, mask=image.split()[-1])
+        return flat
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+def shrink_image(source_path, target_path, size, fmt='JPEG', quality=85, optimize=False):
+    """Write a copy of source_path that fits inside size; target may equal source"""
+    image = open_bounded(source_path, size)
+    if fmt == 'JPEG':
+        image = flatten(image)
+    image.save(target_path, fmt, quality=quality, optimize=optimize)
+    return image.size
@@ -0,0 +1,113 @@
+"""Minimal in-repo pub/sub backend for running several Socket.IO workers on one host.
+
+Production deployments should point SOCKETIO_MESSAGE_QUEUE at Redis. This
+stand-in exists for tests and local multi-worker runs without a Redis server:
+
+    python -m utils.local_pubsub --port 6390
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:6390 python app.py
+
+Protocol: each client sends one header line, "SUB <channel>" or "PUB", then
+newline-delimited JSON. Published lines are {"channel": ..., "data": ...} and
+are forwarded verbatim to every subscriber of that channel.
+"""
+import argparse
+import json
+import socket
+import socketserver
+import threading
+from urllib.parse import urlparse
+
+import socketio
+
+DEFAULT_PORT = 6390
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        header = self.rfile.readline().decode().strip()
+        if header.startswith('SUB '):
+            self.server.subscribe(header[4:], self.wfile)
+            # Hold the connection open until the subscriber goes away
+            while self.rfile.readline():
+                pass
+            self.server.unsubscribe(self.wfile)
+        elif header == 'PUB':
+            for line in self.rfile:
+                self.server.publish(line)
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        super().__init__((host, port), _BrokerHandler)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, stream):
+        with self._lock:
+            self._subscribers[stream] = channel
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            self._subscribers.pop(stream, None)
+
+    def publish(self, line):
+        channel = json.loads(line).get('channel')
+        with self._lock:
+            targets = [stream for stream, subscribed in self._subscribers.items() if subscribed == channel]
+        for stream in targets:
+            try:
+                stream.write(line)
+                stream.flush()
+            except OSError:
+                self.unsubscribe(stream)
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """Socket.IO client manager that talks to a LocalBroker at local://host:port"""
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:6390', channel='flask-socketio', write_only=False, logger=None,
+                 json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_PORT)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self, header):
+        conn = socket.create_connection(self.address)
+        conn.sendall(f'{header}\n'.encode())
+        return conn
+
+    def _publish(self, data):
+        line = (self.json.dumps({'channel': self.channel, 'data': self.json.dumps(data)}) + '\n').encode()
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect('PUB')
+                    self._publisher.sendall(line)
+                    return
+                except OSError:
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        conn = self._connect(f'SUB {self.channel}')
+        with conn.makefile('rb') as stream:
+            for line in stream:
+                yield self.json.loads(line)['data']
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the local Socket.IO pub/sub broker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    with LocalBroker(args.host, args.port) as broker:
+        print(f"Local pub/sub broker listening on {args.host}:{args.port}")
+        broker.serve_forever()
+
+if __name__ == '__main__':
+    main()
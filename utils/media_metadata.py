@@ -0,0 +1,175 @@
+"""Layout metadata extracted from media at ingest.
+
+Clients need an attachment's shape before its bytes arrive, so every new
+blob gets width/height, duration (audio and video), a dominant colour and a
+placeholder: a ~16px WebP as a data URI that the browser can paint blurred
+while the real image loads (BlurHash-style, but with no client decoder).
+
+Images are read through the already rendered thumbnail when there is one,
+so the original is only opened for its header. MP4/MOV/M4A durations and
+video sizes come from the container's mvhd/tkhd boxes and WAV from the
+wave module; other containers need ffprobe on PATH and are skipped without it.
+Video sizes are in display orientation: portrait phone videos store landscape
+frames plus a 90/270 degree rotation, which swaps width and height.
+"""
+import base64
+import io
+import json
+import logging
+import shutil
+import struct
+import subprocess
+import wave
+
+from PIL import Image
+
+from utils.imaging import open_bounded, flatten, _ROTATED_ORIENTATIONS, _ORIENTATION_TAG
+
+METADATA_FIELDS = ('width', 'height', 'duration', 'dominant_color', 'placeholder')
+PLACEHOLDER_SIZE = (16, 16)
+PALETTE_COLORS = 5
+FFPROBE_TIMEOUT_SECONDS = 10
+MP4_CONTAINER_BOXES = (b'moov', b'trak')
+
+def extract_metadata(path, file_type, preview_path=None):
+    """Dict of width, height, duration, dominant_color and placeholder (missing values are None)"""
+    metadata = dict.fromkeys(METADATA_FIELDS)
+    try:
+        if file_type.startswith('image/'):
+            metadata.update(_image_metadata(path, preview_path))
+        elif file_type.startswith(('video/', 'audio/')):
+            metadata.update(_stream_metadata(path, file_type))
+    except Exception as e:
+        logging.error(f"Metadata extraction error for {path}: {str(e)}")
+    return metadata
+
+def _image_metadata(path, preview_path=None):
+    with Image.open(path) as source:
+        width, height = source.size
+        if source.getexif().get(_ORIENTATION_TAG, 1) in _ROTATED_ORIENTATIONS:
+            width, height = height, width
+
+    # The thumbnail is already upright and small; fall back to a draft-mode decode
+    small = open_bounded(preview_path or path, (64, 64))
+    small = flatten(small)
+    return {
+        'width': width,
+        'height': height,
+        'dominant_color': dominant_color(small),
+        'placeholder': placeholder_for(small)
+    }
+
+def dominant_color(image):
+    """Hex colour of the largest cluster in a small palette of image"""
+    palette_image = image.quantize(colors=PALETTE_COLORS, method=Image.Quantize.MEDIANCUT)
+    count, index = max(palette_image.getcolors())
+    red, green, blue = palette_image.getpalette()[index * 3:index * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+def placeholder_for(image):
+    """data: URI of a tiny WebP of image, a few hundred bytes"""
+    tiny = image.copy()
+    tiny.thumbnail(PLACEHOLDER_SIZE, Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'WEBP', quality=30)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+def _stream_metadata(path, file_type):
+    subtype = file_type.split('/', 1)[1]
+    if subtype in ('mp4', 'quicktime', 'x-m4a', 'mp4a', 'm4a', 'aac'):
+        metadata = _mp4_metadata(path)
+        if metadata.get('duration') is not None:
+            return metadata
+    if subtype in ('wav', 'x-wav', 'wave'):
+        with wave.open(path) as audio:
+            return {'duration': round(audio.getnframes() / audio.getframerate(), 3)}
+    return _ffprobe_metadata(path)
+
+def _mp4_boxes(handle, end):
+    while handle.tell() + 8 <= end:
+        start = handle.tell()
+        size, kind = struct.unpack('>I4s', handle.read(8))
+        if size == 1:
+            size = struct.unpack('>Q', handle.read(8))[0]
+        elif size == 0:
+            size = end - start
+        if size < 8:
+            return
+        yield kind, handle.tell(), start + size
+        handle.seek(start + size)
+
+def _mp4_metadata(path):
+    """Duration from moov/mvhd and the first video track's size from trak/tkhd"""
+    metadata = {}
+    with open(path, 'rb') as handle:
+        handle.seek(0, 2)
+        pending = [(0, handle.tell())]
+        while pending:
+            start, end = pending.pop(0)
+            handle.seek(start)
+            for kind, body, box_end in _mp4_boxes(handle, end):
+                if kind in MP4_CONTAINER_BOXES:
+                    pending.append((body, box_end))
+                elif kind == b'mvhd':
+                    handle.seek(body)
+                    version = handle.read(1)[0]
+                    if version == 1:
+                        handle.seek(body + 20)
+                        timescale, duration = struct.unpack('>IQ', handle.read(12))
+                    else:
+                        handle.seek(body + 12)
+                        timescale, duration = struct.unpack('>II', handle.read(8))
+                    if timescale:
+                        metadata['duration'] = round(duration / timescale, 3)
+                elif kind == b'tkhd' and 'width' not in metadata:
+                    # The box ends with the 3x3 display matrix then width and height, 16.16 fixed
+                    # point; audio tracks carry 0
+                    handle.seek(box_end - 44)
+                    matrix = struct.unpack('>9i', handle.read(36))
+                    width, height = struct.unpack('>II', handle.read(8))
+                    if width and height:
+                        width, height = width >> 16, height >> 16
+                        if _is_quarter_turn(matrix):
+                            width, height = height, width
+                        metadata['width'], metadata['height'] = width, height
+    return metadata
+
+def _is_quarter_turn(matrix):
+    """True for a tkhd matrix that rotates by 90 or 270 degrees: a = d = 0, b and c non-zero"""
+    a, b, _, c, d = matrix[:5]
+    return a == 0 and d == 0 and b != 0 and c != 0
+
+def _ffprobe_metadata(path):
+    ffprobe = shutil.which('ffprobe')
+    if not ffprobe:
+        return {}
+
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+        capture_output=True, timeout=FFPROBE_TIMEOUT_SECONDS, check=True
+    )
+    probe = json.loads(result.stdout)
+    metadata = {}
+    duration = probe.get('format', {}).get('duration')
+    if duration:
+        metadata['duration'] = round(float(duration), 3)
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video' and stream.get('width'):
+            metadata['width'], metadata['height'] = stream['width'], stream['height']
+            if _ffprobe_rotation(stream) % 180 == 90:
+                metadata['width'], metadata['height'] = stream['height'], stream['width']
+            break
+    return metadata
+
+def _ffprobe_rotation(stream):
+    """Degrees from the display matrix side data, or the older rotate tag"""
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(side_data['rotation'])
+    return int(stream.get('tags', {}).get('rotate', 0))
+
+def copy_metadata(source, target):
+    """Copy extracted values from a dict, Media or MediaBlob onto a Media or MediaBlob row"""
+    for field in METADATA_FIELDS:
+        value = source.get(field) if isinstance(source, dict) else getattr(source, field)
+        setattr(target, field, value)
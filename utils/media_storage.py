@@ -0,0 +1,277 @@
+"""Where uploaded media lives on disk.
+
+Media is kept under MEDIA_ROOT (instance/media), outside the static folder:
+blob names are content digests, so a public path would let anyone holding a
+copy of a photo check for it and fetch it. Files are only served by the
+permission-checked download and rendition views.
+
+Files used to go into one flat directory per kind (images/, videos/, ...),
+which turns into a directory with hundreds of thousands of entries. The
+sharded layout adds two levels taken from the file name:
+
+    instance/media/images/ab/cd/abcd1234...jpg
+
+Content-addressed names (and the uuid names written before blobs) start with
+hex, so their first four characters are the shard; any other name is sharded
+by the SHA-256 of the name. Paths are stored relative to the app, exactly as
+before, so rows written under either layout keep working.
+
+MediaStorage.send() serves a stored file with Range and ETag/Last-Modified
+conditional responses, or, with MEDIA_SENDFILE set, answers with only an
+X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) header so the
+fronting proxy streams the bytes once the view has checked permissions.
+The proxy must only reach MEDIA_ROOT through that header. For nginx, map
+MEDIA_ACCEL_PREFIX to it with an internal location, which clients cannot
+request directly:
+
+    location /protected-media/ {
+        internal;
+        alias /srv/lunalink/instance/media/;
+    }
+
+For Apache, allow the folder with XSendFilePath and nothing else.
+
+migrate_media_layout() moves existing files into shards, and files still
+under the old public root (static/uploads) into MEDIA_ROOT, while the app
+keeps serving them. Until it has run, those old paths answer 404 on /static/:
+
+    python -m utils.media_storage --batch-size 200
+"""
+import argparse
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import string
+import time
+
+from flask import abort, current_app, request, send_file
+
+from models import db, Media, MediaBlob
+
+MEDIA_ROOT = 'instance/media'
+LEGACY_ROOT = 'static/uploads'
+MEDIA_LAYOUTS = ('sharded', 'flat')
+SENDFILE_MODES = ('', 'x-accel', 'x-sendfile')
+MIGRATION_BATCH_SIZE = 200
+
+def _shard(name):
+    stem = name.rsplit('.', 1)[0].lower()
+    if len(stem) < 4 or any(char not in string.hexdigits for char in stem[:4]):
+        stem = hashlib.sha256(name.encode()).hexdigest()
+    return stem[:2], stem[2:4]
+
+class MediaStorage:
+    """Maps (folder, file name) to a path under MEDIA_ROOT and moves files into place"""
+
+    def __init__(self, root=MEDIA_ROOT, layout='sharded'):
+        self.root = root
+        self.layout = layout
+        self.sendfile = ''
+        self.accel_prefix = '/protected-media'
+        self.max_age = 7 * 24 * 60 * 60
+
+    def init_app(self, app):
+        layout = app.config.get('MEDIA_LAYOUT', self.layout)
+        if layout not in MEDIA_LAYOUTS:
+            raise ValueError(f"Unknown MEDIA_LAYOUT: {layout}")
+        sendfile = app.config.get('MEDIA_SENDFILE', self.sendfile)
+        if sendfile not in SENDFILE_MODES:
+            raise ValueError(f"Unknown MEDIA_SENDFILE: {sendfile}")
+        self.root = app.config.get('MEDIA_ROOT', self.root)
+        self.layout = layout
+        self.sendfile = sendfile
+        self.accel_prefix = app.config.get('MEDIA_ACCEL_PREFIX', self.accel_prefix)
+        self.max_age = app.config.get('MEDIA_MAX_AGE_SECONDS', self.max_age)
+        app.before_request(_hide_legacy_uploads)
+
+    def path_for(self, folder, name, layout=None):
+        """Relative path a new file called name in folder (images, thumbnails, ...) is stored at"""
+        if (layout or self.layout) == 'flat':
+            return os.path.join(self.root, folder, name)
+        return os.path.join(self.root, folder, *_shard(name), name)
+
+    def canonical_path(self, path):
+        """Where an existing stored path belongs under the configured root and layout"""
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(os.pardir):
+            # Uploads written before MEDIA_ROOT sat in the public static folder
+            relative = os.path.relpath(path, LEGACY_ROOT)
+            if relative.startswith(os.pardir):
+                return path
+        folder = relative.split(os.sep)[0]
+        return self.path_for(folder, os.path.basename(path))
+
+    def put(self, source_path, folder, name):
+        """Move a finished file into the store; returns its stored path"""
+        path = self.path_for(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        return path
+
+    def exists(self, path):
+        return bool(path) and os.path.exists(path)
+
+    def local_path(self, path):
+        """Filesystem path to hand to send_file for a stored path"""
+        return os.path.abspath(path)
+
+    def send(self, path, mimetype=None, as_attachment=False, download_name=None, etag=True):
+        """Response for a stored file, conditional and Range-aware, or offloaded to the proxy
+
+        Pass etag as a string (e.g. the blob digest) when the file's content
+        has a stable identity; True derives one from the file's stat.
+        """
+        local = self.local_path(path)
+        download_name = download_name or os.path.basename(path)
+        mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+        # Offload only what lives under MEDIA_ROOT, the one folder the proxy maps
+        if not self.sendfile or os.path.relpath(path, self.root).startswith(os.pardir):
+            response = send_file(
+                local, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                conditional=True, etag=etag
+            )
+            response.accept_ranges = 'bytes'
+        else:
+            stat = os.stat(local)
+            response = current_app.response_class(mimetype=mimetype)
+            if self.sendfile == 'x-accel':
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = f"{self.accel_prefix.rstrip('/')}/{relative}"
+            else:
+                response.headers['X-Sendfile'] = local
+            response.headers.set(
+                'Content-Disposition', 'attachment' if as_attachment else 'inline', filename=download_name
+            )
+            response.last_modified = stat.st_mtime
+            response.set_etag(etag if isinstance(etag, str) else f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+            # 304s are answered here; the proxy handles Range itself
+            response.make_conditional(request.environ)
+            response.headers.pop('Content-Length', None)
+
+        # Media is per-couple, so keep it out of shared caches
+        response.cache_control.no_cache = None
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = self.max_age
+        return response
+
+media_storage = MediaStorage()
+
+def _hide_legacy_uploads():
+    """404 for files not yet migrated out of static/; they are served by /chat/download like the rest"""
+    if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith('uploads/'):
+        abort(404)
+
+def _link_or_copy(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source, target)
+
+def _relocate(path, moves):
+    """Plan the move for one stored path; returns the path rows should point at"""
+    if not path:
+        return path
+    target = media_storage.canonical_path(path)
+    if target == path:
+        return path
+    if path in moves:
+        return moves[path]
+    if os.path.exists(path):
+        _link_or_copy(path, target)
+    elif not os.path.exists(target):
+        # Nothing on disk under either name; leave the row alone
+        return path
+    moves[path] = target
+    return target
+
+def _rewrite_paths(model, column, moves):
+    for old, new in moves.items():
+        model.query.filter(column == old).update({column: new}, synchronize_session=False)
+
+def migrate_media_layout(batch_size=MIGRATION_BATCH_SIZE, pause=0.05):
+    """Move media files into the configured layout in id-ordered batches.
+
+    Each batch links (or copies) its files to their new paths, rewrites
+    Media and MediaBlob paths in one transaction and only then removes the
+    old names, so a download racing the migration always finds the file.
+    Safe to re-run; returns the number of files moved.
+    """
+    socketio = current_app.extensions.get('socketio')
+    sleep = socketio.sleep if socketio else time.sleep
+    last_id = 0
+    total = 0
+
+    while True:
+        rows = db.session.query(Media.id, Media.file_path, Media.thumbnail_path).filter(
+            Media.id > last_id
+        ).order_by(Media.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        moves = {}
+        for row in rows:
+            _relocate(row.file_path, moves)
+            _relocate(row.thumbnail_path, moves)
+        if not moves:
+            continue
+
+        try:
+            _rewrite_paths(Media, Media.file_path, moves)
+            _rewrite_paths(Media, Media.thumbnail_path, moves)
+            _rewrite_paths(MediaBlob, MediaBlob.file_path, moves)
+            _rewrite_paths(MediaBlob, MediaBlob.thumbnail_path, moves)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for target in moves.values():
+                if os.path.exists(target):
+                    os.remove(target)
+            raise
+
+        for old in moves:
+            if os.path.exists(old):
+                os.remove(old)
+        total += len(moves)
+
+        if pause:
+            sleep(pause)
+
+    # Blobs whose Media rows are all gone still carry their own paths
+    moves = {}
+    for blob in MediaBlob.query.all():
+        _relocate(blob.file_path, moves)
+        _relocate(blob.thumbnail_path, moves)
+    if moves:
+        _rewrite_paths(MediaBlob, MediaBlob.file_path, moves)
+        _rewrite_paths(MediaBlob, MediaBlob.thumbnail_path, moves)
+        db.session.commit()
+        for old in moves:
+            if os.path.exists(old):
+                os.remove(old)
+        total += len(moves)
+
+    logging.info(f"Moved {total} media files to the '{media_storage.layout}' layout")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description='Move stored media files into the configured MEDIA_LAYOUT')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.05)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        moved = migrate_media_layout(args.batch_size, args.pause)
+    print(f"Moved {moved} media files to the '{media_storage.layout}' layout")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Message, User
+
+def with_message_relations(query, users=None):
+    """Eager-load the relations the serializers touch so a page costs a fixed number of queries"""
+    query = query.options(selectinload(Message.media))
+    if users is None:
+        # No preloaded couple to resolve senders from, so join them in
+        query = query.options(joinedload(Message.sender))
+    return query
+
+def conversation_users(user, other_user_id=None):
+    """Map user ids to the two already-loaded members of a conversation"""
+    users = {user.id: user}
+
+    if other_user_id is None or int(other_user_id) == user.partner_id:
+        partner = user.partner
+    else:
+        partner = User.query.get(int(other_user_id))
+
+    if partner:
+        users[partner.id] = partner
+    return users
+
+def _sender(message, users):
+    sender = users.get(message.sender_id) if users else None
+    return sender if sender is not None else message.sender
+
+def serialize_media_metadata(media):
+    """Layout hints so clients can size a placeholder before the file loads"""
+    return {
+        'width': media.width,
+        'height': media.height,
+        'duration': media.duration,
+        'dominant_color': media.dominant_color,
+        'placeholder': media.placeholder
+    }
+
+def media_url(media):
+    """Permission-checked, Range-capable URL for a media file; stored paths are never public"""
+    return f"/chat/download/{media.id}?inline=1"
+
+def serialize_media(media):
+    """Serialize a Media row for message payloads"""
+    return {
+        'id': media.id,
+        'file_path': media.file_path,
+        'url': media_url(media),
+        'file_type': media.file_type,
+        'thumbnail_path': media.thumbnail_path,
+        **serialize_media_metadata(media)
+    }
+
+def serialize_message(message, users=None):
+    """Serialize a Message for HTTP responses and socket emits"""
+    sender = _sender(message, users)
+
+    message_data = {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender_name': sender.name,
+        'content': message.text,
+        'type': message.message_type,
+        'timestamp': message.timestamp.isoformat(),
+        'is_read': message.is_read,
+        'avatar': sender.avatar
+    }
+
+    if message.media:
+        message_data['media'] = serialize_media(message.media[0])
+
+    return message_data
+
+def serialize_messages(messages, users=None):
+    return [serialize_message(message, users) for message in messages]
+
+def serialize_gallery_item(media, message, users=None):
+    """Serialize one media attachment for the media gallery"""
+    return {
+        'id': media.id,
+        'message_id': message.id,
+        'file_path': media.file_path,
+        'url': media_url(media),
+        'file_type': media.file_type,
+        'thumbnail_path': media.thumbnail_path,
+        **serialize_media_metadata(media),
+        'timestamp': message.timestamp.isoformat(),
+        'month': message.timestamp.strftime('%Y-%m'),
+        'sender_name': _sender(message, users).name
+    }
+
+def serialize_memory(message, users=None):
+    """Serialize a Message for the memories timeline template"""
+    sender = _sender(message, users)
+
+    memory = {
+        'id': message.id,
+        'type': 'message',
+        'content': message.text,
+        'timestamp': message.timestamp,
+        'sender': sender.name,
+        'sender_avatar': sender.avatar
+    }
+
+    if message.media:
+        memory['type'] = 'media'
+        memory['media'] = {
+            'id': message.media[0].id,
+            'file_path': message.media[0].file_path,
+            'file_type': message.media[0].file_type
+        }
+
+    return memory
@@ -0,0 +1,108 @@
+import logging
+import time
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, Message
+from utils.encryption import encrypt_many, decrypt_many
+
+STORAGE_MODES = ('dual', 'ciphertext', 'plaintext')
+COMPACTION_BATCH_SIZE = 500
+
+def storage_mode():
+    mode = current_app.config.get('MESSAGE_STORAGE_MODE', 'dual')
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown MESSAGE_STORAGE_MODE: {mode}")
+    return mode
+
+def message_body_fields(text, encrypted_content=None):
+    """Column values for a message body under the configured storage mode.
+
+    'dual' keeps plaintext and ciphertext, 'ciphertext' keeps only the
+    encrypted copy (content is left empty because the column is NOT NULL),
+    'plaintext' keeps only content. Reads go through Message.text.
+    """
+    if text is None:
+        return {'content': None, 'encrypted_content': None}
+
+    mode = storage_mode()
+    if mode == 'plaintext':
+        return {'content': text, 'encrypted_content': None}
+
+    if encrypted_content is None:
+        encrypted_content = encrypt_many([text])[0]
+    if mode == 'ciphertext':
+        return {'content': '', 'encrypted_content': encrypted_content}
+    return {'content': text, 'encrypted_content': encrypted_content}
+
+def _pending_rows_query(mode):
+    query = db.session.query(Message.id, Message.content, Message.encrypted_content)
+    if mode == 'ciphertext':
+        return query.filter(Message.content != '')
+    if mode == 'plaintext':
+        return query.filter(Message.encrypted_content.isnot(None))
+    # Dual: plaintext-only rows need ciphertext, ciphertext-only rows need their plaintext back
+    return query.filter(db.or_(
+        db.and_(Message.encrypted_content.is_(None), Message.content.isnot(None)),
+        db.and_(Message.content == '', Message.encrypted_content.isnot(None))
+    ))
+
+def compact_message_storage(mode=None, batch_size=COMPACTION_BATCH_SIZE, pause=0.05):
+    """Rewrite existing rows to the target storage mode in small id-ordered chunks.
+
+    Each chunk is its own transaction and the loop sleeps between chunks, so
+    the chat keeps writing while this runs. Safe to re-run; returns rows changed.
+    """
+    mode = mode or storage_mode()
+    socketio = current_app.extensions.get('socketio')
+    sleep = socketio.sleep if socketio else time.sleep
+    last_id = 0
+    total = 0
+
+    while True:
+        rows = _pending_rows_query(mode).filter(Message.id > last_id).order_by(
+            Message.id
+        ).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        if mode == 'plaintext':
+            texts = decrypt_many([row.encrypted_content for row in rows if not row.content])
+            texts = iter(texts)
+            changes = [
+                {'id': row.id, 'content': row.content or next(texts), 'encrypted_content': None}
+                for row in rows
+            ]
+        elif mode == 'ciphertext':
+            ciphertexts = iter(encrypt_many([row.content for row in rows if not row.encrypted_content]))
+            changes = [
+                {'id': row.id, 'content': '', 'encrypted_content': row.encrypted_content or next(ciphertexts)}
+                for row in rows
+            ]
+        else:
+            texts = iter(decrypt_many([row.encrypted_content for row in rows if not row.content]))
+            ciphertexts = iter(encrypt_many([row.content for row in rows if not row.encrypted_content]))
+            changes = [
+                {
+                    'id': row.id,
+                    'content': row.content or next(texts),
+                    'encrypted_content': row.encrypted_content or next(ciphertexts)
+                }
+                for row in rows
+            ]
+            # A genuinely empty message decrypts back to ''; nothing to write for it
+            changes = [change for change, row in zip(changes, rows) if change['content'] != row.content
+                       or change['encrypted_content'] != row.encrypted_content]
+            if not changes:
+                continue
+
+        db.session.execute(update(Message), changes)
+        db.session.commit()
+        total += len(changes)
+
+        if pause:
+            sleep(pause)
+
+    logging.info(f"Compacted {total} messages to '{mode}' storage")
+    return total
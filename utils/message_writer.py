@@ -0,0 +1,129 @@
+import logging
+import queue
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from models import db, Message, User, conversation_key_for
+from utils.message_serializer import serialize_message
+
+PendingMessage = namedtuple('PendingMessage', [
+    'sender_id', 'receiver_id', 'content', 'encrypted_content', 'message_type', 'timestamp', 'sid'
+])
+
+class MessageWriter:
+    """Write-behind stage that group-commits chat messages queued by socket handlers.
+
+    A single background task blocks on the queue while idle. Once a message arrives
+    it waits MESSAGE_BATCH_INTERVAL_SECONDS for others to join (or not at all when
+    MESSAGE_BATCH_SIZE are already waiting), writes the batch in one transaction
+    and only then emits new_message / message_sent.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.queue_empty = queue.Empty
+        self.app = None
+        self.socketio = None
+        self.after_write = None
+        self.batch_size = 64
+        self.interval = 0.005
+        self._started = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio, after_write=None):
+        self.app = app
+        self.socketio = socketio
+        self.after_write = after_write
+        # Blocking on a stdlib queue would stall an unpatched eventlet/gevent hub
+        self.queue = socketio.server.eio.create_queue()
+        self.queue_empty = socketio.server.eio.get_queue_empty_exception()
+        self.batch_size = app.config.get('MESSAGE_BATCH_SIZE', self.batch_size)
+        self.interval = app.config.get('MESSAGE_BATCH_INTERVAL_SECONDS', self.interval)
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config.get('MESSAGE_WRITE_BEHIND'))
+
+    def submit(self, sender_id, receiver_id, content, encrypted_content=None, message_type='text', sid=None):
+        """Queue a message for the next group commit"""
+        self._ensure_started()
+        self.queue.put(PendingMessage(
+            sender_id, receiver_id, content, encrypted_content, message_type, datetime.utcnow(), sid
+        ))
+
+    def _ensure_started(self):
+        with self._lock:
+            if not self._started:
+                self.socketio.start_background_task(self._run)
+                self._started = True
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if self.queue.qsize() + 1 < self.batch_size:
+                self.socketio.sleep(self.interval)
+
+            batch = [first] + self.drain(self.batch_size - 1)
+            with self.app.app_context():
+                payloads = self.write_batch(batch)
+                self.emit_batch(batch, payloads)
+
+    def drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except self.queue_empty:
+                break
+        return batch
+
+    def write_batch(self, batch):
+        """Persist a batch in one transaction; returns serialized payloads or None on failure"""
+        messages = [
+            Message(
+                sender_id=item.sender_id,
+                receiver_id=item.receiver_id,
+                conversation_key=conversation_key_for(item.sender_id, item.receiver_id),
+                content=item.content,
+                encrypted_content=item.encrypted_content,
+                message_type=item.message_type,
+                timestamp=item.timestamp,
+                is_read=False,
+                media=[]
+            )
+            for item in batch
+        ]
+
+        try:
+            user_ids = {item.sender_id for item in batch}
+            users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+
+            db.session.add_all(messages)
+            if self.after_write:
+                for sender_id, receiver_id in {(item.sender_id, item.receiver_id) for item in batch}:
+                    self.after_write(sender_id, receiver_id, commit=False)
+            db.session.flush()
+
+            # Serialize while ids are assigned and before commit expires the rows
+            payloads = [serialize_message(message, users) for message in messages]
+            db.session.commit()
+            return payloads
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Message batch write error: {str(e)}")
+            return None
+
+    def emit_batch(self, batch, payloads):
+        if payloads is None:
+            for item in batch:
+                if item.sid:
+                    self.socketio.emit('error', {'message': 'Failed to send message'}, to=item.sid)
+            return
+
+        for item, message_data in zip(batch, payloads):
+            self.socketio.emit('new_message', message_data, room=f'user_{item.receiver_id}')
+            if item.sid:
+                self.socketio.emit('message_sent', message_data, to=item.sid)
+
+message_writer = MessageWriter()
@@ -0,0 +1,94 @@
+import logging
+from sqlalchemy import inspect, text
+
+from models import db
+
+BACKFILL_BATCH_SIZE = 5000
+
+MESSAGE_INDEXES = {
+    'ix_messages_conversation_timestamp': 'conversation_key, timestamp',
+    'ix_messages_conversation_id': 'conversation_key, id',
+    'ix_messages_receiver_unread': 'receiver_id, is_read, sender_id',
+}
+
+def _column_names(table_name):
+    return {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+
+def _index_names(table_name):
+    return {index['name'] for index in inspect(db.engine).get_indexes(table_name)}
+
+def migrate_conversation_keys(batch_size=BACKFILL_BATCH_SIZE):
+    """Add messages.conversation_key, its indexes, and backfill existing rows in batches"""
+    if 'conversation_key' not in _column_names('messages'):
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE messages ADD COLUMN conversation_key VARCHAR(32)"))
+        logging.info("Added messages.conversation_key column")
+
+    existing_indexes = _index_names('messages')
+    for index_name, columns in MESSAGE_INDEXES.items():
+        if index_name not in existing_indexes:
+            with db.engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX {index_name} ON messages ({columns})"))
+            logging.info(f"Created {index_name} index")
+
+    # Backfill in small transactions so the writer lock is never held for long
+    backfill = text("""
+        UPDATE messages
+        SET conversation_key = CASE
+            WHEN sender_id < receiver_id
+                THEN CAST(sender_id AS VARCHAR(16)) || ':' || CAST(receiver_id AS VARCHAR(16))
+            ELSE CAST(receiver_id AS VARCHAR(16)) || ':' || CAST(sender_id AS VARCHAR(16))
+        END
+        WHERE id IN (
+            SELECT id FROM messages WHERE conversation_key IS NULL LIMIT :batch_size
+        )
+    """)
+
+    total = 0
+    while True:
+        with db.engine.begin() as conn:
+            updated = conn.execute(backfill, {'batch_size': batch_size}).rowcount
+        if not updated:
+            break
+        total += updated
+
+    if total:
+        logging.info(f"Backfilled conversation_key on {total} messages")
+    return total
+
+def migrate_media_blobs():
+    """Add media.blob_digest for the content-addressed store; media_blobs itself comes from create_all"""
+    if 'blob_digest' not in _column_names('media'):
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE media ADD COLUMN blob_digest VARCHAR(64) REFERENCES media_blobs (digest)"))
+        logging.info("Added media.blob_digest column")
+
+    if 'ix_media_blob_digest' not in _index_names('media'):
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX ix_media_blob_digest ON media (blob_digest)"))
+        logging.info("Created ix_media_blob_digest index")
+
+MEDIA_METADATA_COLUMNS = {
+    'width': 'INTEGER',
+    'height': 'INTEGER',
+    'duration': 'FLOAT',
+    'dominant_color': 'VARCHAR(7)',
+    'placeholder': 'VARCHAR(512)',
+}
+
+def migrate_media_metadata():
+    """Add the layout metadata columns to media and media_blobs; existing rows stay NULL"""
+    for table_name in ('media', 'media_blobs'):
+        existing = _column_names(table_name)
+        for column, column_type in MEDIA_METADATA_COLUMNS.items():
+            if column in existing:
+                continue
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}"))
+            logging.info(f"Added {table_name}.{column} column")
+
+def run_migrations():
+    """Apply in-place schema migrations that db.create_all() cannot perform"""
+    migrate_conversation_keys()
+    migrate_media_blobs()
+    migrate_media_metadata()
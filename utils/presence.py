@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import update
+
+from models import db, User
+from utils.cluster_bus import cluster_bus
+
+# A worker that has not synced for this many flush intervals is presumed dead
+WORKER_EXPIRY_INTERVALS = 3
+
+class PresenceRegistry:
+    """Presence: open sockets ref-counted per user, across every worker.
+
+    last_seen is kept in memory and written to users in one batched UPDATE
+    every PRESENCE_FLUSH_INTERVAL_SECONDS, so reconnect storms do not become
+    write storms. A user stays online until their last socket closes.
+
+    Online/offline events go only to the partner's room. An offline event is
+    held for PRESENCE_DEBOUNCE_SECONDS and dropped if the user reconnects in
+    the meantime, so flapping connections produce no events at all.
+
+    With several workers, each one publishes when a user gains their first
+    or loses their last socket on it, and its full online set every flush
+    interval (see utils/cluster_bus.py). A user is online while any worker
+    holds one of their sockets; the set of a worker that stops syncing is
+    dropped after WORKER_EXPIRY_INTERVALS intervals.
+    """
+
+    def __init__(self):
+        self._sockets = {}
+        self._remote = {}
+        self._workers = {}
+        self._last_seen = {}
+        self._dirty = set()
+        self._announced = set()
+        self._hidden = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self.app = None
+        self.socketio = None
+        self.flush_interval = 30
+        self.debounce = 5
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.flush_interval = app.config.get('PRESENCE_FLUSH_INTERVAL_SECONDS', self.flush_interval)
+        self.debounce = app.config.get('PRESENCE_DEBOUNCE_SECONDS', self.debounce)
+        cluster_bus.subscribe('presence.sockets', self._remote_sockets)
+        cluster_bus.subscribe('presence.sync', self._remote_sync)
+        cluster_bus.subscribe('presence.offline', self._remote_offline)
+
+    def connect(self, user_id, sid):
+        """Register a socket; returns True when it is the user's first one"""
+        self._ensure_started()
+        with self._lock:
+            sockets = self._sockets.setdefault(user_id, set())
+            first = not sockets
+            sockets.add(sid)
+            self._mark_seen(user_id)
+        return first
+
+    def disconnect(self, user_id, sid):
+        """Drop a socket; returns True when the user has no sockets left"""
+        with self._lock:
+            sockets = self._sockets.get(user_id)
+            if sockets is None:
+                return False
+            sockets.discard(sid)
+            self._mark_seen(user_id)
+            if sockets:
+                return False
+            del self._sockets[user_id]
+        return True
+
+    def user_connected(self, user, sid):
+        """Register a socket and tell the partner if the user just came online"""
+        if not self.connect(user.id, sid):
+            return False
+
+        visible = _shows_online_status(user)
+        with self._lock:
+            if visible:
+                self._hidden.discard(user.id)
+            else:
+                self._hidden.add(user.id)
+            # Still announced means the offline event is pending or another worker
+            # already has the user online: stay quiet
+            already_announced = user.id in self._announced or bool(self._remote.get(user.id))
+            self._announced.add(user.id)
+
+        cluster_bus.publish('presence.sockets', user_id=user.id, online=True, hidden=not visible)
+        if already_announced:
+            return False
+
+        self._announce(user.id, user.partner_id, 'online', visible, user_name=user.name)
+        return True
+
+    def user_disconnected(self, user, sid):
+        """Drop a socket and schedule the partner's offline event after the debounce window"""
+        if not self.disconnect(user.id, sid):
+            return False
+
+        visible = user.id not in self._hidden
+        cluster_bus.publish('presence.sockets', user_id=user.id, online=False, hidden=not visible)
+        self.socketio.start_background_task(self._deferred_offline, user.id, user.partner_id, visible)
+        return True
+
+    def _deferred_offline(self, user_id, partner_id, visible):
+        self.socketio.sleep(self.debounce)
+        with self._lock:
+            if self.is_online(user_id) or user_id not in self._announced:
+                return
+            self._announced.discard(user_id)
+        self._announce(user_id, partner_id, 'offline', visible)
+        cluster_bus.publish('presence.offline', user_id=user_id)
+
+    def _announce(self, user_id, partner_id, status, visible, user_name=None):
+        if not partner_id or not visible:
+            return
+
+        payload = {'user_id': user_id, 'status': status}
+        if user_name:
+            payload['user_name'] = user_name
+        self.socketio.emit(f'user_{status}', payload, room=f'user_{partner_id}')
+
+    def touch(self, user_id):
+        with self._lock:
+            self._mark_seen(user_id)
+
+    def _mark_seen(self, user_id):
+        self._last_seen[user_id] = datetime.utcnow()
+        self._dirty.add(user_id)
+
+    def is_online(self, user_id):
+        return bool(self._sockets.get(user_id) or self._remote.get(user_id))
+
+    def is_visible(self, user_id):
+        """Online and sharing that fact (UserSettings.show_online_status)"""
+        return self.is_online(user_id) and user_id not in self._hidden
+
+    def connection_count(self, user_id):
+        """Sockets the user holds on this worker"""
+        return len(self._sockets.get(user_id, ()))
+
+    def _remote_sockets(self, message):
+        """Another worker's user gained their first or lost their last socket there"""
+        self._ensure_started()
+        user_id, worker = message['user_id'], message['worker']
+        with self._lock:
+            self._workers[worker] = time.monotonic()
+            if message.get('hidden'):
+                self._hidden.add(user_id)
+            else:
+                self._hidden.discard(user_id)
+            if message['online']:
+                self._remote.setdefault(user_id, set()).add(worker)
+                # Announced by the worker that holds the socket, or about to be
+                self._announced.add(user_id)
+            else:
+                self._drop_remote(user_id, worker)
+
+    def _remote_sync(self, message):
+        """Another worker's full online set; replaces whatever was heard from it before"""
+        self._ensure_started()
+        worker = message['worker']
+        online = set(message['online'])
+        hidden = set(message['hidden'])
+        with self._lock:
+            self._workers[worker] = time.monotonic()
+            for user_id in [user_id for user_id, workers in self._remote.items()
+                            if worker in workers and user_id not in online]:
+                self._drop_remote(user_id, worker)
+            for user_id in online:
+                self._remote.setdefault(user_id, set()).add(worker)
+                self._announced.add(user_id)
+                if user_id in hidden:
+                    self._hidden.add(user_id)
+                else:
+                    self._hidden.discard(user_id)
+
+    def _remote_offline(self, message):
+        """Another worker told the partner this user went offline"""
+        with self._lock:
+            if not self.is_online(message['user_id']):
+                self._announced.discard(message['user_id'])
+
+    def _drop_remote(self, user_id, worker):
+        workers = self._remote.get(user_id)
+        if workers is None:
+            return
+        workers.discard(worker)
+        if not workers:
+            del self._remote[user_id]
+
+    def sync(self):
+        """Publish this worker's online set and forget workers that went quiet"""
+        with self._lock:
+            online = list(self._sockets)
+            hidden = [user_id for user_id in online if user_id in self._hidden]
+            cutoff = time.monotonic() - WORKER_EXPIRY_INTERVALS * self.flush_interval
+            for worker in [worker for worker, heard in self._workers.items() if heard < cutoff]:
+                del self._workers[worker]
+                for user_id in [user_id for user_id, workers in self._remote.items() if worker in workers]:
+                    self._drop_remote(user_id, worker)
+        cluster_bus.publish('presence.sync', online=online, hidden=hidden)
+
+    def last_seen_for(self, user):
+        """Freshest known last_seen for a User: in memory first, then the column"""
+        return self._last_seen.get(user.id) or user.last_seen
+
+    def flush(self):
+        """Write pending last_seen values in one batched UPDATE; returns rows written"""
+        with self._lock:
+            pending = [{'id': user_id, 'last_seen': self._last_seen[user_id]} for user_id in self._dirty]
+            self._dirty = set()
+
+        if not pending:
+            return 0
+
+        try:
+            db.session.execute(update(User), pending)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            with self._lock:
+                self._dirty.update(row['id'] for row in pending)
+            logging.error(f"Presence flush error: {str(e)}")
+            return 0
+        return len(pending)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started or self.socketio is None:
+                return
+            self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.flush_interval)
+            self.sync()
+            with self.app.app_context():
+                self.flush()
+
+def _shows_online_status(user):
+    settings = user.settings
+    return settings.show_online_status if settings else True
+
+presence = PresenceRegistry()
@@ -0,0 +1,86 @@
+import logging
+import threading
+from sqlalchemy import update
+
+from models import db, Message, UserSettings
+
+# (reader_id, sender_id) -> highest message id acknowledged in the current window
+_pending_acks = {}
+_pending_lock = threading.Lock()
+
+def mark_messages_read(reader_id, sender_id, up_to_id=None):
+    """Flip every unread message from sender to reader in one UPDATE.
+
+    Returns (first_id, last_id, count) for the rows that changed, or
+    (None, None, 0) when nothing was unread. The id range is only known on
+    dialects with UPDATE ... RETURNING; elsewhere it is reported as None.
+    """
+    stmt = update(Message).filter_by(
+        receiver_id=reader_id,
+        sender_id=sender_id,
+        is_read=False
+    ).values(is_read=True).execution_options(synchronize_session=False)
+
+    if up_to_id is not None:
+        stmt = stmt.where(Message.id <= up_to_id)
+
+    if getattr(db.engine.dialect, 'update_returning', False):
+        ids = db.session.execute(stmt.returning(Message.id)).scalars().all()
+        db.session.commit()
+        if not ids:
+            return None, None, 0
+        return min(ids), max(ids), len(ids)
+
+    count = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return None, None, count
+
+def notify_messages_read(socketio, reader_id, sender_id, up_to_id, first_id=None, last_id=None, count=0):
+    """Send one coalesced messages_read event to the sender, honouring the reader's privacy setting"""
+    settings = UserSettings.query.filter_by(user_id=reader_id).first()
+    if settings and not settings.read_receipts:
+        return False
+
+    socketio.emit('messages_read', {
+        'reader_id': reader_id,
+        'up_to_id': up_to_id,
+        'first_id': first_id,
+        'last_id': last_id,
+        'count': count
+    }, room=f'user_{sender_id}')
+    return True
+
+def queue_read_ack(app, reader_id, sender_id, up_to_id):
+    """Record a read high-water mark; the first ack in a window schedules the flush.
+
+    Later acks inside READ_RECEIPT_DEBOUNCE_SECONDS only raise the mark, so a
+    burst costs one UPDATE and one emit.
+    """
+    key = (reader_id, sender_id)
+    with _pending_lock:
+        pending = _pending_acks.get(key)
+        _pending_acks[key] = up_to_id if pending is None else max(pending, up_to_id)
+        if pending is not None:
+            return False
+
+    app.extensions['socketio'].start_background_task(_flush_read_ack, app, key)
+    return True
+
+def _flush_read_ack(app, key):
+    socketio = app.extensions['socketio']
+    socketio.sleep(app.config.get('READ_RECEIPT_DEBOUNCE_SECONDS', 0.5))
+
+    with _pending_lock:
+        up_to_id = _pending_acks.pop(key, None)
+    if up_to_id is None:
+        return
+
+    reader_id, sender_id = key
+    with app.app_context():
+        try:
+            first_id, last_id, count = mark_messages_read(reader_id, sender_id, up_to_id)
+            if count:
+                notify_messages_read(socketio, reader_id, sender_id, up_to_id, first_id, last_id, count)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Read receipt flush error: {str(e)}")
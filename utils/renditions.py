@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+from flask import current_app
+from utils.imaging import open_bounded, flatten
+
+# Requested widths snap up to one of these so the cache holds a few variants per image
+RENDITION_WIDTHS = (160, 320, 640, 1280, 1920)
+RENDITION_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+}
+
+def snap_width(width):
+    for candidate in RENDITION_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return RENDITION_WIDTHS[-1]
+
+class RenditionCache:
+    """Resized copies of image originals, rendered on first request.
+
+    Files live in RENDITION_CACHE_FOLDER, named by media id, width, format
+    and a fingerprint of the original, so a replaced original never serves a
+    stale rendition. Hits bump the file's mtime; once the folder grows past
+    RENDITION_CACHE_MAX_BYTES the least recently used files are deleted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _folder(self):
+        folder = current_app.config.get('RENDITION_CACHE_FOLDER', 'instance/renditions')
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def etag_for(self, media, width, fmt):
+        """Strong validator derived from the original's identity, not from the rendered bytes"""
+        stat = os.stat(media.file_path)
+        seed = f"{media.id}:{width}:{fmt}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha256(seed.encode()).hexdigest()[:32]
+
+    def get(self, media, width, fmt):
+        """Path to the rendition, rendering it first if it is not cached"""
+        etag = self.etag_for(media, width, fmt)
+        path = os.path.join(self._folder(), f"{media.id}-{width}-{etag}.{RENDITION_FORMATS[fmt][2]}")
+
+        if os.path.exists(path):
+            os.utime(path)
+            return path, etag
+
+        size = render(media.file_path, path, width, fmt)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+        self._evict(keep=os.path.basename(path))
+        return path, etag
+
+    def _evict(self, keep=None):
+        budget = current_app.config.get('RENDITION_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= budget:
+                return
+
+            folder = self._folder()
+            entries = []
+            for name in os.listdir(folder):
+                try:
+                    stat = os.stat(os.path.join(folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= budget:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    os.remove(os.path.join(folder, name))
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = total
+
+def render(source_path, target_path, width, fmt):
+    """Write a width-bounded copy of source_path; returns its size in bytes"""
+    pil_format = RENDITION_FORMATS[fmt][0]
+    # Width-bounded only: the height limit never binds
+    image = open_bounded(source_path, (width, 1 << 16))
+    if pil_format == 'JPEG':
+        image = flatten(image)
+
+    # Write under a temporary name so concurrent readers never see a partial file
+    temp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        image.save(temp_path, pil_format, quality=82)
+        os.replace(temp_path, target_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        logging.error(f"Rendition error for {source_path}")
+        raise
+    return os.path.getsize(target_path)
+
+rendition_cache = RenditionCache()
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import request
+from flask_socketio import disconnect
+
+from models import UserSettings
+from utils.identity_cache import identity_cache
+
+SocketContext = namedtuple('SocketContext', [
+    'user_id', 'name', 'partner_id', 'partner_name', 'partner_room',
+    'read_receipts', 'typing_indicators', 'show_online_status'
+])
+
+def build_context(user, settings=None):
+    partner = user.partner
+    settings = settings if settings is not None else user.settings
+    return SocketContext(
+        user_id=user.id,
+        name=user.name,
+        partner_id=partner.id if partner else None,
+        partner_name=partner.name if partner else None,
+        partner_room=f'user_{partner.id}' if partner else None,
+        read_receipts=settings.read_receipts if settings else True,
+        typing_indicators=settings.typing_indicators if settings else True,
+        show_online_status=settings.show_online_status if settings else True
+    )
+
+class SocketContextRegistry:
+    """Immutable per-sid snapshot of who is on a socket, captured at connect.
+
+    Hot socket events read everything they need from here instead of
+    resolving current_user, the partner and UserSettings again. A commit that
+    changes the user, their partner or their settings, on this worker or any
+    other, marks the user stale; the next event on any of their sockets
+    rebuilds the context once. Contexts are also rebuilt once they are
+    IDENTITY_CACHE_TTL_SECONDS old, in case a cross-worker message was lost.
+    """
+
+    def __init__(self):
+        self._by_sid = {}
+        self._sids = {}
+        self._stale = set()
+        self._built = {}
+        self._lock = threading.Lock()
+        self.ttl = 60
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL_SECONDS', self.ttl)
+        identity_cache.on_write(self.invalidate)
+
+    def open(self, sid, user):
+        context = build_context(user)
+        with self._lock:
+            self._by_sid[sid] = context
+            self._sids.setdefault(user.id, set()).add(sid)
+            self._built.setdefault(user.id, time.monotonic())
+        return context
+
+    def close(self, sid):
+        with self._lock:
+            context = self._by_sid.pop(sid, None)
+            if context is None:
+                return None
+            sids = self._sids.get(context.user_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._sids[context.user_id]
+                    self._stale.discard(context.user_id)
+                    self._built.pop(context.user_id, None)
+        return context
+
+    def get(self, sid):
+        context = self._by_sid.get(sid)
+        if context is None:
+            return None
+        if context.user_id in self._stale:
+            return self._refresh_or_close(sid, context.user_id)
+        if self._built.get(context.user_id, 0) < time.monotonic() - self.ttl:
+            # Expired rather than invalidated: the cached snapshot may be just as old
+            identity_cache.invalidate(context.user_id)
+            return self._refresh_or_close(sid, context.user_id)
+        return context
+
+    def _refresh_or_close(self, sid, user_id):
+        """Rebuild the user's context, or drop the sid if the account is gone"""
+        context = self._refresh(user_id)
+        if context is None:
+            self.close(sid)
+        return context
+
+    def _refresh(self, user_id):
+        user = identity_cache.load(user_id)
+        if user is None:
+            return None
+        settings = UserSettings.query.filter_by(user_id=user_id).first()
+        context = build_context(user, settings)
+        with self._lock:
+            self._stale.discard(user_id)
+            self._built[user_id] = time.monotonic()
+            for sid in self._sids.get(user_id, ()):
+                self._by_sid[sid] = context
+        return context
+
+    def invalidate(self, user_ids):
+        """Mark connected users stale when they, their settings or their partner changed"""
+        with self._lock:
+            for context in self._by_sid.values():
+                if context.user_id in user_ids or context.partner_id in user_ids:
+                    self._stale.add(context.user_id)
+
+def socket_context_required(f):
+    """Pass the sid's SocketContext as the first argument; drop unauthenticated sockets"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        context = socket_contexts.get(request.sid)
+        if context is None:
+            disconnect()
+            return None
+        return f(context, *args, **kwargs)
+    return decorated_function
+
+socket_contexts = SocketContextRegistry()
@@ -0,0 +1,166 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, ChatStreak, Message
+
+PENDING_DATES_KEY = 'streak_pending_dates'
+
+def couple_id_for(user_id, partner_id):
+    """Streaks are stored once per couple, under the lower of the two user ids"""
+    return min(int(user_id), int(partner_id))
+
+def _advance(streak, today):
+    if streak.last_chat_date == today - timedelta(days=1):
+        streak.streak_count += 1
+    elif streak.last_chat_date is None or streak.last_chat_date < today - timedelta(days=1):
+        streak.streak_count = 1
+
+    streak.last_chat_date = today
+    streak.longest_streak = max(streak.longest_streak or 0, streak.streak_count)
+
+class StreakService:
+    """Per-couple chat streaks with last_chat_date cached in process memory.
+
+    A streak can only change when a couple's first message of a UTC day
+    arrives, so every later message that day is answered from the cache
+    without touching the database. The date is only cached once the streak
+    row is committed; with commit=False that is the caller's commit, so a
+    rolled-back batch leaves the day to be recorded again.
+    """
+
+    def __init__(self):
+        self._last_chat_dates = {}
+        # Reentrant: record_message's own commit can fire committed() for dates queued earlier
+        self._lock = threading.RLock()
+
+    def record_message(self, user_id, partner_id, commit=True, today=None):
+        """Advance the couple's streak if this is their first message today.
+
+        Returns True when the database was touched.
+        """
+        couple_id = couple_id_for(user_id, partner_id)
+        today = today or datetime.utcnow().date()
+
+        if self._last_chat_dates.get(couple_id) == today:
+            return False
+
+        with self._lock:
+            if self._last_chat_dates.get(couple_id) == today:
+                return False
+
+            streak = ChatStreak.query.filter_by(couple_id=couple_id).first()
+            if not streak:
+                streak = ChatStreak(couple_id=couple_id, streak_count=1, longest_streak=1, last_chat_date=today)
+                db.session.add(streak)
+            elif streak.last_chat_date != today:
+                # Another worker may already have rolled the day over
+                _advance(streak, today)
+
+            if commit:
+                db.session.commit()
+                self._last_chat_dates[couple_id] = today
+            else:
+                db.session.info.setdefault(PENDING_DATES_KEY, {})[couple_id] = today
+            return True
+
+    def committed(self, dates):
+        """Cache dates whose streak rows just committed (Session after_commit)"""
+        with self._lock:
+            self._last_chat_dates.update(dates)
+
+    def forget(self, couple_id=None):
+        """Drop cached dates, e.g. after reconciliation rewrote the rows"""
+        with self._lock:
+            if couple_id is None:
+                self._last_chat_dates.clear()
+            else:
+                self._last_chat_dates.pop(couple_id, None)
+
+    def get_streak(self, user_id, partner_id):
+        return ChatStreak.query.filter_by(couple_id=couple_id_for(user_id, partner_id)).first()
+
+def _streaks_from_days(days, today):
+    """(current, longest, last_day) from a sorted list of distinct chat days"""
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous and day == previous + timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+
+    current = run if previous and previous >= today - timedelta(days=1) else 0
+    return current, longest, previous
+
+def reconcile_streaks(today=None):
+    """Rebuild every couple's streak from message history.
+
+    Distinct chat days per conversation come from one aggregated query; the
+    per-user rows written before streaks were per couple are folded away.
+    Returns the number of couples written.
+    """
+    today = today or datetime.utcnow().date()
+    chat_day = db.func.date(Message.timestamp)
+
+    rows = db.session.query(Message.conversation_key, chat_day).filter(
+        Message.conversation_key.isnot(None)
+    ).filter_by(is_deleted=False).group_by(
+        Message.conversation_key, chat_day
+    ).order_by(Message.conversation_key, chat_day).all()
+
+    days_by_couple = {}
+    for conversation_key, day in rows:
+        couple_id = int(conversation_key.split(':', 1)[0])
+        if isinstance(day, str):
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        days_by_couple.setdefault(couple_id, []).append(day)
+
+    streaks = {streak.couple_id: streak for streak in ChatStreak.query.all()}
+    for couple_id, days in days_by_couple.items():
+        current, longest, last_day = _streaks_from_days(days, today)
+        streak = streaks.pop(couple_id, None)
+        if not streak:
+            streak = ChatStreak(couple_id=couple_id)
+            db.session.add(streak)
+        streak.streak_count = current
+        streak.longest_streak = longest
+        streak.last_chat_date = last_day
+
+    # Leftover rows belong to the higher-id partner (old per-user streaks) or to couples with no messages
+    for streak in streaks.values():
+        db.session.delete(streak)
+
+    db.session.commit()
+    streak_service.forget()
+    logging.info(f"Reconciled chat streaks for {len(days_by_couple)} couples")
+    return len(days_by_couple)
+
+def start_nightly_reconciliation(app, socketio):
+    """Run reconcile_streaks shortly after every UTC midnight"""
+    def run():
+        while True:
+            now = datetime.utcnow()
+            next_run = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) + timedelta(minutes=5)
+            socketio.sleep((next_run - now).total_seconds())
+            with app.app_context():
+                try:
+                    reconcile_streaks()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Streak reconciliation error: {str(e)}")
+
+    return socketio.start_background_task(run)
+
+def _cache_committed_dates(session):
+    dates = session.info.pop(PENDING_DATES_KEY, None)
+    if dates:
+        streak_service.committed(dates)
+
+def _discard_pending_dates(session, previous_transaction):
+    session.info.pop(PENDING_DATES_KEY, None)
+
+streak_service = StreakService()
+event.listen(Session, 'after_commit', _cache_committed_dates)
+event.listen(Session, 'after_soft_rollback', _discard_pending_dates)
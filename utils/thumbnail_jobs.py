@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from models import db, Media, Message
+from utils.file_handler import generate_image_thumbnail
+from utils.blob_store import record_thumbnail, record_metadata
+from utils.media_metadata import extract_metadata, copy_metadata
+from utils.message_serializer import serialize_media_metadata
+
+def process_media(path, file_type):
+    """Pool task: thumbnail (images only) then layout metadata, read from the thumbnail where possible"""
+    thumbnail_path = None
+    if file_type.startswith('image'):
+        thumbnail_path = generate_image_thumbnail(path, os.path.basename(path))
+    return thumbnail_path, extract_metadata(path, file_type, preview_path=thumbnail_path)
+
+class ThumbnailJobs:
+    """Thumbnails and layout metadata computed in a process pool, off the request thread.
+
+    The upload request stores the file and commits its Media row with no
+    thumbnail or metadata; a background task hands the work to one of
+    THUMBNAIL_WORKERS processes, writes Media.thumbnail_path and the metadata
+    columns and emits media_ready to both members of the conversation. At
+    most THUMBNAIL_MAX_PENDING files are in the pool at once; later ones wait
+    in their background task.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.executor = None
+        self.workers = 2
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.workers = app.config.get('THUMBNAIL_WORKERS', self.workers)
+        self._slots = threading.BoundedSemaphore(app.config.get('THUMBNAIL_MAX_PENDING', 32))
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config.get('THUMBNAIL_ASYNC'))
+
+    def _executor(self):
+        with self._lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def submit(self, media_id, path, file_type):
+        """Schedule thumbnail and metadata extraction for a committed Media row"""
+        self.socketio.start_background_task(self._run, media_id, path, file_type)
+
+    def _run(self, media_id, path, file_type):
+        while not self._slots.acquire(blocking=False):
+            self.socketio.sleep(0.05)
+        try:
+            future = self._executor().submit(process_media, path, file_type)
+            # Poll rather than block so eventlet/gevent hubs keep serving sockets
+            while not future.done():
+                self.socketio.sleep(0.02)
+            thumbnail_path, metadata = future.result()
+        except Exception as e:
+            logging.error(f"Media job error for media {media_id}: {str(e)}")
+            thumbnail_path, metadata = None, None
+        finally:
+            self._slots.release()
+
+        with self.app.app_context():
+            self.complete(media_id, thumbnail_path, metadata)
+
+    def complete(self, media_id, thumbnail_path, metadata=None):
+        """Store the thumbnail and metadata and tell both sides of the conversation"""
+        media = db.session.get(Media, media_id)
+        if media is None:
+            return
+        media.thumbnail_path = thumbnail_path
+        if media.blob_digest and thumbnail_path:
+            record_thumbnail(media.blob_digest, thumbnail_path)
+        if metadata:
+            copy_metadata(metadata, media)
+            if media.blob_digest:
+                record_metadata(media.blob_digest, metadata)
+        db.session.commit()
+
+        message = db.session.get(Message, media.message_id)
+        payload = {
+            'message_id': media.message_id,
+            'media_id': media.id,
+            'thumbnail_path': thumbnail_path,
+            **serialize_media_metadata(media)
+        }
+        for user_id in {message.sender_id, message.receiver_id}:
+            self.socketio.emit('media_ready', payload, room=f'user_{user_id}')
+
+    def shutdown(self):
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+thumbnail_jobs = ThumbnailJobs()
@@ -0,0 +1,162 @@
+import threading
+import time
+
+from models import UserSettings
+from utils.cluster_bus import cluster_bus
+
+class TypingRelay:
+    """Per-user typing state kept in process memory.
+
+    The partner only hears state transitions: user_typing when a burst starts
+    and user_stop_typing when it ends. Repeated typing events inside a burst
+    just push the expiry out. A stop is held for TYPING_STOP_GRACE_SECONDS so a
+    pause between words does not flap the indicator, and a burst with no
+    activity for TYPING_TIMEOUT_SECONDS is stopped by the sweeper.
+
+    With several workers the worker that started a burst owns it; the others
+    keep a replica (see utils/cluster_bus.py). Typing on a replica extends the
+    owner's expiry and a stop on a replica is forwarded, so a user with tabs
+    on two workers still produces one start and one stop.
+    """
+
+    def __init__(self):
+        self._typing = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.socketio = None
+        self.timeout = 5
+        self.grace = 1
+        self.sweep_interval = 0.5
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.timeout = app.config.get('TYPING_TIMEOUT_SECONDS', self.timeout)
+        self.grace = app.config.get('TYPING_STOP_GRACE_SECONDS', self.grace)
+        self.sweep_interval = app.config.get('TYPING_SWEEP_INTERVAL_SECONDS', self.sweep_interval)
+        cluster_bus.subscribe('typing.start', self._remote_start)
+        cluster_bus.subscribe('typing.touch', self._remote_touch)
+        cluster_bus.subscribe('typing.stop', self._remote_stop)
+        cluster_bus.subscribe('typing.end', self._remote_end)
+
+    def start(self, user_id, partner_id, user_name, shares_typing=None):
+        """Mark the user as typing; returns True when the partner was notified.
+
+        shares_typing is UserSettings.typing_indicators when the caller already
+        has it (socket context); otherwise it is looked up once per burst.
+        """
+        if not partner_id:
+            return False
+
+        self._ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            state = self._typing.get(user_id)
+            if state:
+                state['expires'] = now + self.timeout
+        if state:
+            if state['remote']:
+                cluster_bus.publish('typing.touch', user_id=user_id)
+            return False
+
+        if shares_typing is None:
+            shares_typing = _shares_typing(user_id)
+        if not shares_typing:
+            return False
+
+        with self._lock:
+            if user_id in self._typing:
+                self._typing[user_id]['expires'] = now + self.timeout
+                return False
+            self._typing[user_id] = {'partner_id': partner_id, 'expires': now + self.timeout, 'remote': False}
+
+        self.socketio.emit('user_typing', {
+            'user_id': user_id,
+            'user_name': user_name,
+            'typing': True
+        }, room=f'user_{partner_id}')
+        cluster_bus.publish('typing.start', user_id=user_id, partner_id=partner_id)
+        return True
+
+    def stop(self, user_id, immediate=False):
+        """End the user's burst, after the grace window unless immediate"""
+        with self._lock:
+            state = self._typing.get(user_id)
+            if not state:
+                return False
+            if not immediate and not state['remote']:
+                state['expires'] = min(state['expires'], time.monotonic() + self.grace)
+                return False
+            if immediate:
+                del self._typing[user_id]
+
+        if state['remote']:
+            # The owning worker announces the stop
+            cluster_bus.publish('typing.stop', user_id=user_id, immediate=immediate)
+            return False
+        self._announce_stop(user_id, state['partner_id'])
+        return True
+
+    def is_typing(self, user_id):
+        return user_id in self._typing
+
+    def sweep(self, now=None):
+        """Stop every burst past its expiry; returns how many were stopped"""
+        now = now or time.monotonic()
+        with self._lock:
+            expired = [(user_id, state) for user_id, state in self._typing.items() if state['expires'] <= now]
+            for user_id, _ in expired:
+                del self._typing[user_id]
+
+        # Replicas just lapse; their owner announces
+        expired = [(user_id, state['partner_id']) for user_id, state in expired if not state['remote']]
+        for user_id, partner_id in expired:
+            self._announce_stop(user_id, partner_id)
+        return len(expired)
+
+    def _announce_stop(self, user_id, partner_id):
+        self.socketio.emit('user_stop_typing', {'user_id': user_id, 'typing': False}, room=f'user_{partner_id}')
+        cluster_bus.publish('typing.end', user_id=user_id)
+
+    def _remote_start(self, message):
+        self._ensure_started()
+        with self._lock:
+            self._typing.setdefault(message['user_id'], {
+                'partner_id': message['partner_id'],
+                'expires': time.monotonic() + self.timeout,
+                'remote': True
+            })
+
+    def _remote_touch(self, message):
+        with self._lock:
+            state = self._typing.get(message['user_id'])
+            if state:
+                state['expires'] = time.monotonic() + self.timeout
+
+    def _remote_stop(self, message):
+        state = self._typing.get(message['user_id'])
+        if state and not state['remote']:
+            self.stop(message['user_id'], immediate=message['immediate'])
+
+    def _remote_end(self, message):
+        with self._lock:
+            state = self._typing.get(message['user_id'])
+            if state and state['remote']:
+                del self._typing[message['user_id']]
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started or self.socketio is None:
+                return
+            self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.sweep_interval)
+            self.sweep()
+
+def _shares_typing(user_id):
+    settings = UserSettings.query.filter_by(user_id=user_id).first()
+    return settings.typing_indicators if settings else True
+
+typing_relay = TypingRelay()
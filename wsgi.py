@@ -0,0 +1,107 @@
+"""Production entrypoint for LunaLink.
+
+    python wsgi.py                       # SERVER_WORKERS processes on SERVER_PORT, SERVER_PORT + 1, ...
+    gunicorn -k eventlet -w 1 wsgi:app   # or let gunicorn own a single worker
+
+SOCKETIO_ASYNC_MODE picks eventlet, gevent or threading; unset, the first of
+eventlet and gevent that is installed wins (requirements.txt pins eventlet).
+Threading mode is Werkzeug's development server and is refused unless
+SERVER_ALLOW_DEV_SERVER is set, which only benchmarks and tests should do.
+The monkey patching for eventlet/gevent has to happen before anything else is
+imported, which is why this module settles the mode from the plain Config
+class first and hands that same mode to SocketIO. Running more than one
+worker needs SOCKETIO_MESSAGE_QUEUE and a load balancer with sticky sessions;
+the same queue carries the presence and typing state workers share.
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+
+from config import Config
+
+def resolve_async_mode(requested):
+    """The configured mode, else eventlet or gevent if installed, else threading"""
+    if requested:
+        return requested
+    for mode in ('eventlet', 'gevent'):
+        if importlib.util.find_spec(mode):
+            return mode
+    return 'threading'
+
+ASYNC_MODE = resolve_async_mode(Config.SOCKETIO_ASYNC_MODE)
+# create_app() passes this to SocketIO, which must not auto-detect a mode nothing patched
+Config.SOCKETIO_ASYNC_MODE = ASYNC_MODE
+
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import create_app, prepare_app, socketio
+from utils.cluster_bus import cluster_bus
+
+WORKER_INDEX = int(os.environ.get('SERVER_WORKER_INDEX', 0))
+IS_SUPERVISOR = __name__ == '__main__' and Config.SERVER_WORKERS > 1
+
+app = create_app()
+# Migrations run once up front; nightly jobs only in the first worker
+prepare_app(app, background_jobs=not IS_SUPERVISOR and WORKER_INDEX == 0)
+if not IS_SUPERVISOR:
+    # Presence, typing and cache updates from the other workers
+    cluster_bus.start()
+
+def server_options(config):
+    """Connection limits for the selected async server"""
+    if socketio.async_mode == 'eventlet':
+        return {'max_size': config['SERVER_MAX_CONNECTIONS']}
+    if socketio.async_mode == 'gevent':
+        return {'spawn': config['SERVER_MAX_CONNECTIONS']}
+    # Threading mode runs Werkzeug's development server: no connection cap, not hardened
+    if not config.get('SERVER_ALLOW_DEV_SERVER'):
+        sys.exit("Refusing to serve with Werkzeug's development server (async mode 'threading'). "
+                 "Install eventlet or gevent, or set SERVER_ALLOW_DEV_SERVER=true for benchmarks and tests.")
+    print("⚠️  WARNING: serving with Werkzeug's development server (threading mode); not for production")
+    return {'allow_unsafe_werkzeug': True}
+
+def serve(port):
+    options = server_options(app.config)
+    print(f"🚀 LunaLink worker {WORKER_INDEX} ({socketio.async_mode}) on {app.config['SERVER_HOST']}:{port}")
+    socketio.run(
+        app,
+        host=app.config['SERVER_HOST'],
+        port=port,
+        debug=False,
+        use_reloader=False,
+        **options
+    )
+
+def supervise(workers):
+    """Start one worker process per port and wait for them"""
+    if not app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        sys.exit('SERVER_WORKERS > 1 requires SOCKETIO_MESSAGE_QUEUE so workers can reach each other')
+
+    base_port = app.config['SERVER_PORT']
+    processes = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env=dict(os.environ, SERVER_PORT=str(base_port + index), SERVER_WORKERS='1',
+                     SERVER_WORKER_INDEX=str(index))
+        )
+        for index in range(workers)
+    ]
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == '__main__':
+    if IS_SUPERVISOR:
+        supervise(app.config['SERVER_WORKERS'])
+    else:
+        serve(app.config['SERVER_PORT'])